@@ -2,36 +2,86 @@ import time
 
 import machine
 import uasyncio as asyncio
+import uheapq as heapq
+from utime import ticks_diff, ticks_ms
+
+import taskprof
+
+# longest sleep between checks, keeping the ms clock clear of ticks wraparound.
+MAX_SLEEP_MS = 3600000
 
 
 class AlarmRTC(machine.RTC):
-    """RTC implementing the alarm fns."""
+    """
+    RTC implementing the alarm fns.
+
+    Deadlines are kept in a min-heap, and the loop sleeps until the earliest
+    one rather than scanning every alarm each second.
+    """
 
     def __init__(self):
         self._alarms = {}
-        asyncio.get_event_loop().create_task(self._alarm_loop())
+        self._heap = []
+        self._ms = 0
+        self._last = ticks_ms()
+        self._event = asyncio.Event()
+        taskprof.create_task("alarm_rtc", self._alarm_loop())
         super().__init__()
 
+    def _now(self):
+        """Milliseconds since start, which unlike ticks_ms never wraps."""
+        t = ticks_ms()
+        self._ms += ticks_diff(t, self._last)
+        self._last = t
+        return self._ms
+
     @staticmethod
-    async def run_fn(fn, alarm_id):
-        fn(alarm_id)
+    def _run(fn, alarm_id):
+        res = fn(alarm_id)
+        # coroutine functions return a generator to be scheduled.
+        if hasattr(res, "send"):
+            taskprof.create_task("alarm_handler", res)
+
+    def _schedule(self, alarm_id, deadline):
+        heapq.heappush(self._heap, (deadline, alarm_id))
+        self._event.set()
 
     async def _alarm_loop(self):
-        """Alarm loop to trigger fns if required."""
+        """Alarm loop to trigger fns when due."""
         while True:
-            now = time.time()
-            for alarm_id, alarm in self._alarms.items():
-                if alarm[0] == now:
-                    if alarm[1]:
-                        if type(alarm[1]).__name__ == "funcion":
-                            asyncio.get_event_loop().create_task(
-                                self.run_fn(alarm[1], alarm_id)
-                            )
-                        else:
-                            asyncio.get_event_loop().create_task(alarm[1](alarm_id))
-                    if alarm[2]:
-                        alarm[0] = time.time() + alarm[2]
-            await asyncio.sleep(1)  # 1s precision
+            now = self._now()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, alarm_id = heapq.heappop(self._heap)
+                alarm = self._alarms.get(alarm_id)
+                # skip entries left behind by cancel or reschedule.
+                if not alarm or alarm[0] != deadline or alarm[3]:
+                    continue
+                if alarm[2]:
+                    # step from the deadline, not from now, so repeats don't
+                    # drift; missed periods are fired once.
+                    missed = (now - deadline) // alarm[2] + 1
+                    alarm[0] = deadline + missed * alarm[2]
+                    heapq.heappush(self._heap, (alarm[0], alarm_id))
+                else:
+                    alarm[3] = True
+                if alarm[1]:
+                    self._run(alarm[1], alarm_id)
+            delay = MAX_SLEEP_MS
+            if self._heap:
+                delay = min(delay, self._heap[0][0] - now)
+            self._event.clear()
+            try:
+                await asyncio.wait_for_ms(self._event.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def alarm_ms(self, id: int, ms, *, repeat=False):
+        """Set alarm id to fire in ms milliseconds, every ms if repeat."""
+        id = int(id)
+        deadline = self._now() + int(ms)
+        # [deadline, handler, period, fired]
+        self._alarms[id] = [deadline, None, int(ms) if repeat else 0, False]
+        self._schedule(id, deadline)
 
     def alarm(self, id: int, _time, *, repeat=False):
         """
@@ -46,12 +96,15 @@ class AlarmRTC(machine.RTC):
         Returns:
         """
         try:
-            _time = time.time() + int(_time)
-            periodic = int(_time) if repeat else False
+            ms = float(_time) * 1000
         except TypeError:
-            _time = time.mktime(_time)
-            periodic = False
-        self._alarms[int(id)] = [_time, None, periodic]
+            ms = (time.mktime(_time) - time.time()) * 1000
+            repeat = False
+        self.alarm_ms(id, ms, repeat=repeat)
+
+    def alarm_left_ms(self, alarm_id: int = 0):
+        """Time in ms to the alarm, negative once elapsed."""
+        return self._alarms[int(alarm_id)][0] - self._now()
 
     def alarm_left(self, alarm_id: int = 0):
         """
@@ -62,7 +115,7 @@ class AlarmRTC(machine.RTC):
         Returns:
           time in s to the alarm.
         """
-        return self._alarms[int(alarm_id)][0] - time.time()
+        return self.alarm_left_ms(alarm_id) // 1000
 
     def cancel(self, alarm_id=0):
         """
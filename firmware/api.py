@@ -1,40 +1,344 @@
 import picoweb
+import uasyncio as asyncio
 import ujson as json
 import ure as re
+from utime import ticks_ms
 
+import boot_phases
 import controller
 import hal
+import memstats
+import taskprof
+import telemetry
+import watchdog
 
 app = picoweb.WebApp(__name__)
 
+MAX_STREAMS = 2
+STREAM_INTERVAL_MS = 500
+STREAM_KEEPALIVE_MS = 15000
+STREAM_FIELDS = ("state", "temperature", "duty", "setpoint", "countdown")
+streams = 0
+# largest JSON body accepted by PUT /api/config.
+MAX_BODY = 1024
+
 
 @app.route("/api/status")
 def status(req, resp):
+    alloc = memstats.alloc_start()
     encoded = json.dumps(
         {
-            "status": controller.heat_enabled,
+            "status": controller.enabled(),
+            "state": controller.state,
             "temperature": hal.temp,
             "temperature_window": hal.avg,
+            "resolution": hal.resolution,
+            "probes": dict(zip(hal.probe_ids, hal.probe_temps)),
+            "fusion": hal.fusion,
             "setpoint": hal.pid.setpoint,
             "duty": hal.relay.duty(),
             "Kp": hal.pid.Kp,
             "Ki": hal.pid.Ki,
             "Kd": hal.pid.Kd,
+            "windup_clamp": hal.config["windup_clamp"],
+            "pid_decimation": hal.config["pid_decimation"],
+            "pid_updates": controller.updates,
+            "pid_latency_ms": controller.latency_ms,
+            "pid_latency_max_ms": controller.latency_max_ms,
             "countdown": hal.rtc.alarm_left(0) if hal.rtc._alarms else False,
             "period": hal.period,
             "brightness": hal.disp.brightness(),
         }
     )
+    memstats.alloc_end("http", alloc)
     yield from picoweb.start_response(resp, content_type="application/json")
     yield from resp.awrite(encoded)
 
 
-@app.route(re.compile("/api/setpoint/(.+)"))
-def set_setpoint(req, resp):
-    val = float(req.url_match.group(1))
+def live_fields():
+    """Current values of STREAM_FIELDS."""
+    return (
+        controller.state,
+        hal.temp,
+        hal.relay.duty(),
+        hal.pid.setpoint,
+        hal.rtc.alarm_left(0) if hal.rtc._alarms else False,
+    )
+
+
+@app.route("/api/stream")
+def stream(req, resp):
+    """
+    Push changed fields as server-sent events.
+
+    The first event carries every field, later ones only those which have
+    changed.  At most MAX_STREAMS clients are served at once.
+    """
+    global streams
+    if streams >= MAX_STREAMS:
+        yield from picoweb.start_response(
+            resp, content_type="application/json", status="503"
+        )
+        yield from resp.awrite(json.dumps({"error": "too many streams"}))
+        return
+    streams += 1
+    try:
+        yield from picoweb.start_response(
+            resp,
+            content_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+        last = [None] * len(STREAM_FIELDS)
+        idle = 0
+        while True:
+            current = live_fields()
+            changed = {
+                name: val
+                for name, old, val in zip(STREAM_FIELDS, last, current)
+                if val != old
+            }
+            if changed:
+                last[:] = current
+                idle = 0
+                yield from resp.awrite("data: " + json.dumps(changed) + "\n\n")
+            elif idle >= STREAM_KEEPALIVE_MS:
+                # lets us notice clients which have gone away
+                idle = 0
+                yield from resp.awrite(":\n\n")
+            yield from asyncio.sleep_ms(STREAM_INTERVAL_MS)
+            idle += STREAM_INTERVAL_MS
+    except OSError:
+        pass
+    finally:
+        streams -= 1
+
+
+@app.route("/api/history")
+def history(req, resp):
+    req.parse_qs()
+    since = int(req.form.get("since", 0))
+    step = int(req.form.get("step", 1))
+    if since < 0 or step < 1:
+        raise Exception("Invalid since or step.")
+    yield from picoweb.start_response(resp, content_type="application/json")
+    for chunk in hal.history.chunks(since, step):
+        yield from resp.awrite(chunk)
+
+
+def check_setpoint(val):
+    val = float(val)
     if val < 0 or val > 100:
         raise Exception("Invalid setpoint.")
-    hal.pid.setpoint = val
+    return val
+
+
+def check_gain(val):
+    val = float(val)
+    if val < 0:
+        raise Exception("Val in wrong range")
+    return val
+
+
+def check_freq(val):
+    val = float(val)
+    if val <= 0 or val > 1:
+        raise Exception("Val in wrong range")
+    return val
+
+
+def check_decimation(val):
+    val = int(val)
+    if val < 1 or val > 60:
+        raise Exception("Decimation must be 1 to 60 samples.")
+    return val
+
+
+def check_brightness(val):
+    val = int(val)
+    # the TM1637 has 8 levels.
+    if val < 0 or val > 7:
+        raise Exception("Invalid brightness.")
+    return val
+
+
+def check_secs(val):
+    val = int(val)
+    if val < 0:
+        raise Exception("Invalid countdown.")
+    return val
+
+
+def check_bool(val):
+    if val is not True and val is not False:
+        raise Exception("Expected true or false.")
+    return val
+
+
+def check_host(val):
+    if not isinstance(val, str) or val and not telemetry.is_ip(val):
+        raise Exception("Host must be an IPv4 address, or empty for none.")
+    return val
+
+
+def check_port(val):
+    val = int(val)
+    if val < 1 or val > 65535:
+        raise Exception("Invalid port.")
+    return val
+
+
+def check_interval(val):
+    val = int(val)
+    if val < 100:
+        raise Exception("Interval must be at least 100 ms.")
+    return val
+
+
+def apply_setpoint(_, val):
+    controller.set_setpoint(val)
+
+
+def apply_gain(param, val):
+    controller.set_gain(param, val)
+
+
+def apply_freq(_, freq):
+    hal.relay.freq(freq)
+    hal.period = hal.relay._period
+    hal.config["freq"] = freq
+
+
+def apply_brightness(_, br):
+    hal.disp.brightness(br)
+    hal.config["brightness"] = br
+
+
+def apply_control_mode(mode, val):
+    hal.config[mode] = val
+    hal.pulse(controller.changed)
+
+
+def apply_countdown(_, secs):
+    if secs:
+        controller.start_countdown(secs)
+    else:
+        controller.stop_countdown()
+
+
+def apply_telemetry(name, val):
+    hal.config[name] = val
+    hal.pulse(telemetry.changed)
+
+
+def apply_enabled(_, val):
+    if val:
+        controller.start_controller()
+    else:
+        controller.stop_controller()
+
+
+# (name, check, apply) for PUT /api/config, in the order they are applied.
+SETTINGS = (
+    ("setpoint", check_setpoint, apply_setpoint),
+    ("Kp", check_gain, apply_gain),
+    ("Ki", check_gain, apply_gain),
+    ("Kd", check_gain, apply_gain),
+    ("freq", check_freq, apply_freq),
+    ("brightness", check_brightness, apply_brightness),
+    ("windup_clamp", check_bool, apply_control_mode),
+    ("pid_decimation", check_decimation, apply_control_mode),
+    ("countdown", check_secs, apply_countdown),
+    ("telemetry_host", check_host, apply_telemetry),
+    ("telemetry_port", check_port, apply_telemetry),
+    ("telemetry_ms", check_interval, apply_telemetry),
+    ("enabled", check_bool, apply_enabled),
+)
+
+
+def read_json(req):
+    """The request's JSON body."""
+    size = int(req.headers[b"Content-Length"])
+    if size > MAX_BODY:
+        raise Exception("Body too long.")
+    return json.loads((yield from req.reader.readexactly(size)))
+
+
+@app.route("/api/config", methods=["PUT"])
+def put_config(req, resp):
+    """
+    Apply the settings in a JSON object body, returning the status.
+
+    Every value is checked before any is applied, so a bad one changes
+    nothing.  The config store writes whatever changed out once, after the
+    request.
+    """
+    settings = yield from read_json(req)
+    if not isinstance(settings, dict):
+        raise Exception("Expected a JSON object.")
+    for name in settings:
+        if not any(name == setting[0] for setting in SETTINGS):
+            raise Exception("Unknown setting {}".format(name))
+    checked = [
+        (apply, name, check(settings[name]))
+        for name, check, apply in SETTINGS
+        if name in settings
+    ]
+    for apply, name, val in checked:
+        apply(name, val)
+    yield from status(req, resp)
+
+
+@app.route("/api/debug/boot")
+def debug_boot(req, resp):
+    encoded = json.dumps(boot_phases.phases)
+    yield from picoweb.start_response(resp, content_type="application/json")
+    yield from resp.awrite(encoded)
+
+
+@app.route("/api/debug/tasks")
+def debug_tasks(req, resp):
+    encoded = json.dumps(taskprof.report())
+    yield from picoweb.start_response(resp, content_type="application/json")
+    yield from resp.awrite(encoded)
+
+
+@app.route(re.compile("^/api/debug/tasks/(on|off)"), methods=["PUT"])
+def profile_tasks(req, resp):
+    val = req.url_match.group(1) == "on"
+    taskprof.enable(val)
+    hal.config["profile_tasks"] = val
+    yield from debug_tasks(req, resp)
+
+
+@app.route("/api/debug/watchdog")
+def debug_watchdog(req, resp):
+    encoded = json.dumps(watchdog.report())
+    yield from picoweb.start_response(resp, content_type="application/json")
+    yield from resp.awrite(encoded)
+
+
+@app.route("/api/debug/telemetry")
+def debug_telemetry(req, resp):
+    encoded = json.dumps(telemetry.report())
+    yield from picoweb.start_response(resp, content_type="application/json")
+    yield from resp.awrite(encoded)
+
+
+@app.route("/api/debug/mem")
+def debug_mem(req, resp):
+    if not memstats.enabled:
+        raise Exception("Memory stats not enabled.")
+    doc = json.dumps(memstats.summary())
+    yield from picoweb.start_response(resp, content_type="application/json")
+    yield from resp.awrite(doc[:-1] + ', "samples": [')
+    for i, row in enumerate(memstats.rows()):
+        yield from resp.awrite("," + row if i else row)
+    yield from resp.awrite("]}")
+
+
+@app.route(re.compile("/api/setpoint/(.+)"))
+def set_setpoint(req, resp):
+    apply_setpoint("setpoint", check_setpoint(req.url_match.group(1)))
     yield from status(req, resp)
 
 
@@ -56,14 +360,19 @@ def set_pid_param(req, resp):
     param = req.url_match.group(1)
     if param not in params:
         raise Exception("Param not in {}".format(params))
-    val = float(req.url_match.group(2))
+    apply_gain(param, check_gain(req.url_match.group(2)))
+    yield from status(req, resp)
+
+
+@app.route(re.compile("^/api/control/(windup_clamp)/(on|off)"), methods=["PUT"])
+def set_control_mode(req, resp):
+    apply_control_mode(req.url_match.group(1), req.url_match.group(2) == "on")
+    yield from status(req, resp)
 
-    if val < 0:
-        raise Exception("Val in wrong range")
-    setattr(hal.pid, param, val)
-    hal.config[param] = val
-    hal.persist_config()
 
+@app.route(re.compile("^/api/control/pid_decimation/([0-9]+)"), methods=["PUT"])
+def set_decimation(req, resp):
+    apply_control_mode("pid_decimation", check_decimation(req.url_match.group(1)))
     yield from status(req, resp)
 
 
@@ -73,10 +382,53 @@ def reset_pid(req, resp):
     yield from status(req, resp)
 
 
+@app.route("/api/gains")
+def gain_schedule(req, resp):
+    encoded = json.dumps(
+        {"band": controller.gains.band, "schedule": controller.gains.rows}
+    )
+    yield from picoweb.start_response(resp, content_type="application/json")
+    yield from resp.awrite(encoded)
+
+
+@app.route(
+    re.compile("^/api/gains/([0-9.]+)/([0-9.]+)/([0-9.]+)/([0-9.]+)"), methods=["PUT"]
+)
+def file_gains(req, resp):
+    setpoint, kp, ki, kd = (float(req.url_match.group(i)) for i in range(1, 5))
+    controller.file_gains(setpoint, kp, ki, kd)
+    yield from gain_schedule(req, resp)
+
+
+@app.route("/api/gains/clear", methods=["PUT"])
+def clear_gains(req, resp):
+    controller.gains.rows.clear()
+    hal.config.touch()
+    controller.apply_gains()
+    yield from gain_schedule(req, resp)
+
+
+@app.route("/api/program", methods=["GET", "PUT"])
+def cook_program(req, resp):
+    """Start the program in a JSON list body if PUT, returning its progress."""
+    if req.method == "PUT":
+        controller.start_program((yield from read_json(req)))
+    encoded = {"state": None}
+    if controller.program is not None:
+        encoded = controller.program.report(ticks_ms())
+    yield from picoweb.start_response(resp, content_type="application/json")
+    yield from resp.awrite(json.dumps(encoded))
+
+
+@app.route("/api/program/stop", methods=["PUT"])
+def stop_program(req, resp):
+    controller.stop_program()
+    yield from status(req, resp)
+
+
 @app.route(re.compile("^/api/countdown/start/([0-9]+)"), methods=["PUT"])
 def set_countdown(req, resp):
-    secs = int(req.url_match.group(1))
-    controller.start_countdown(secs)
+    controller.start_countdown(check_secs(req.url_match.group(1)))
     yield from status(req, resp)
 
 
@@ -88,22 +440,13 @@ def stop_countdown(req, resp):
 
 @app.route(re.compile("^/api/pwm/freq/(.+)"), methods=["PUT"])
 def set_pwm_freq(req, resp):
-    freq = float(req.url_match.group(1))
-    if freq > 1:
-        raise Exception("Val in wrong range")
-    hal.relay.freq(freq)
-    hal.period = hal.relay._period
-    hal.config["freq"] = freq
-    hal.persist_config()
+    apply_freq("freq", check_freq(req.url_match.group(1)))
     yield from status(req, resp)
 
 
-@app.route(re.compile("^/api/backlight/([1-9])"), methods=["PUT"])
+@app.route(re.compile("^/api/backlight/([0-7])"), methods=["PUT"])
 def set_brightness(req, resp):
-    br = int(req.url_match.group(1))
-    hal.disp.brightness(br)
-    hal.config["brightness"] = br
-    hal.persist_config()
+    apply_brightness("brightness", int(req.url_match.group(1)))
     yield from status(req, resp)
 
 
@@ -112,8 +455,7 @@ def manual_output(req, resp):
     duty = int(req.url_match.group(1))
     if duty < 0 or duty > 1023:
         raise Exception("Invalid input for duty")
-    controller.stop_controller()
-    hal.relay.duty(duty)
+    controller.manual(duty)
     yield from status(req, resp)
 
 
@@ -125,31 +467,30 @@ def autotune(req, resp):
     yield from status(req, resp)
 
 
-@app.route("/api/autotune/cancel", method=["PUT"])
+@app.route("/api/autotune/cancel", methods=["PUT"])
 def cancel_autotune(req, resp):
-    controller.tuned = "cancelled"
+    controller.cancel_autotune()
     yield from status(req, resp)
 
 
-@app.route("/api/autotune/status", methods=["PUT"])
+@app.route("/api/autotune/status", methods=["GET", "PUT"])
 def autotune_status(req, resp):
-    if not controller.generated_params:
-        encoded = json.dumps({"status": "in progress"})
-    else:
-        encoded = {}
-        for i, name in enumerate(controller.autotuner.tuning_rules):
+    encoded = controller.autotuner.report()
+    encoded["status"] = "in progress" if controller.autotuner.running() else "done"
+    for i, name in enumerate(controller.autotuner.tuning_rules):
+        if i < len(controller.generated_params):
             encoded[name] = {
                 "Kp": controller.generated_params[i].Kp,
                 "Ki": controller.generated_params[i].Ki,
                 "Kd": controller.generated_params[i].Kd,
             }
-        encoded = json.dumps(encoded)
+    encoded = json.dumps(encoded)
 
     yield from picoweb.start_response(resp, content_type="application/json")
     yield from resp.awrite(encoded)
 
 
-@app.route(re.compile("^/api/hal/temp/window/[0-9]*"), methods=["PUT"])
+@app.route(re.compile("^/api/hal/temp/window/([0-9]+)"), methods=["PUT"])
 def set_temp_window(req, resp):
     val = int(req.url_match.group(1))
     if val < 1:
@@ -159,9 +500,32 @@ def set_temp_window(req, resp):
     yield from status(req, resp)
 
 
+@app.route(re.compile("^/api/hal/temp/resolution/([0-9]+)"), methods=["PUT"])
+def set_resolution(req, resp):
+    bits = int(req.url_match.group(1))
+    hal.set_resolution(bits)
+    hal.config["resolution"] = bits
+    yield from status(req, resp)
+
+
+@app.route(re.compile("^/api/hal/temp/fusion/([a-z]+)"), methods=["PUT"])
+def set_fusion(req, resp):
+    mode = req.url_match.group(1)
+    hal.set_fusion(mode)
+    hal.config["fusion"] = mode
+    yield from status(req, resp)
+
+
 async def run_app():
+    handle = app._handle
+
+    def profiled(reader, writer):
+        # picoweb runs each connection as a task of its own.
+        return taskprof.Profiled("http", handle(reader, writer))
+
+    app._handle = profiled
     app.run(debug=-1, host="0.0.0.0", port="80")
 
 
 def init(loop):
-    loop.create_task(run_app())
+    taskprof.create_task("run_app", run_app())
@@ -0,0 +1,170 @@
+from collections import namedtuple
+from math import pi, sqrt
+
+PIDParams = namedtuple("PIDParams", ("Kp", "Ki", "Kd"))
+
+OFF = "off"
+APPROACHING = "approaching"
+OSCILLATING = "oscillating"
+CONVERGED = "converged"
+UNCONVERGED = "unconverged"
+CANCELLED = "cancelled"
+
+
+class RelayAutotune:
+    """
+    Relay autotune, stopping as soon as the oscillation has converged.
+
+    The heater is switched fully on below `setpoint - hysteresis` and fully
+    off above `setpoint + hysteresis`, which makes the bath oscillate about
+    setpoint.  Each cycle's amplitude and period are measured from the
+    extremes between switches; once the last `min_cycles` of them agree to
+    within `tolerance` the ultimate gain and period give the PID parameters.
+    After `max_cycles` without converging we stop anyway, with the parameters
+    from the last few cycles and a confidence to match.
+    """
+
+    # Kp, Ki, Kd as multiples of Ku, Ku / Pu and Ku * Pu.
+    RULES = {
+        "ziegler-nichols": (0.6, 1.2, 0.075),
+        "tyreus-luyben": (0.4545, 0.2066, 0.0721),
+        "some-overshoot": (0.333, 0.667, 0.111),
+        "no-overshoot": (0.2, 0.4, 0.0667),
+    }
+    tuning_rules = tuple(RULES)
+
+    def __init__(
+        self,
+        out_min=0,
+        out_max=1023,
+        hysteresis=0.2,
+        tolerance=0.05,
+        min_cycles=3,
+        max_cycles=12,
+    ):
+        self.out_min = out_min
+        self.out_max = out_max
+        self.hysteresis = hysteresis
+        self.tolerance = tolerance
+        self.min_cycles = min_cycles
+        self.max_cycles = max_cycles
+        self.setpoint = None
+        self.state = OFF
+        self.output = out_min
+        self.elapsed = 0
+        self.periods = []
+        self.amplitudes = []
+
+    def start(self, setpoint):
+        """Begin tuning about setpoint."""
+        self.setpoint = setpoint
+        self.state = APPROACHING
+        self.output = self.out_max
+        self.elapsed = 0
+        self.periods = []
+        self.amplitudes = []
+        self._extreme = None
+        self._high = None
+        self._low = None
+        self._on_at = None
+
+    def cancel(self):
+        self.state = CANCELLED
+        self.output = self.out_min
+
+    def running(self):
+        return self.state in (APPROACHING, OSCILLATING)
+
+    def run(self, temp, t):
+        """
+        Feed a fresh reading taken t seconds after start.
+
+        Sets `output` to the duty to apply and returns True once finished.
+        """
+        if not self.running():
+            return True
+        self.elapsed = t
+        heating = self.output == self.out_max
+        if self._extreme is None:
+            self._extreme = temp
+        elif heating:
+            self._extreme = min(self._extreme, temp)
+        else:
+            self._extreme = max(self._extreme, temp)
+
+        if heating and temp > self.setpoint + self.hysteresis:
+            # the minimum of a heating phase is only a trough once we have
+            # been above setpoint.
+            if self._on_at is not None:
+                self._low = self._extreme
+            self.output = self.out_min
+            self._extreme = temp
+        elif not heating and temp < self.setpoint - self.hysteresis:
+            self._high = self._extreme
+            if self._on_at is not None:
+                self.periods.append(t - self._on_at)
+                self.amplitudes.append((self._high - self._low) / 2)
+            self._on_at = t
+            self.state = OSCILLATING
+            self.output = self.out_max
+            self._extreme = temp
+            return self._check()
+        return False
+
+    def _check(self):
+        if self.cycles() >= self.min_cycles and self.confidence() >= (
+            1 - self.tolerance
+        ):
+            self.state = CONVERGED
+        elif self.cycles() >= self.max_cycles:
+            self.state = UNCONVERGED
+        else:
+            return False
+        self.output = self.out_min
+        return True
+
+    def cycles(self):
+        return len(self.periods)
+
+    @staticmethod
+    def _spread(vals):
+        mean = sum(vals) / len(vals)
+        return (max(vals) - min(vals)) / mean if mean else 1
+
+    def confidence(self):
+        """How closely the last min_cycles cycles agree, from 0 to 1."""
+        if self.cycles() < 2:
+            return 0
+        n = self.min_cycles
+        spread = max(
+            self._spread(self.periods[-n:]), self._spread(self.amplitudes[-n:])
+        )
+        return max(0, 1 - spread)
+
+    def ultimate(self):
+        """Ultimate gain and period from the last min_cycles cycles."""
+        n = self.min_cycles
+        amplitude = sum(self.amplitudes[-n:]) / len(self.amplitudes[-n:])
+        period = sum(self.periods[-n:]) / len(self.periods[-n:])
+        d = (self.out_max - self.out_min) / 2
+        if amplitude > self.hysteresis:
+            amplitude = sqrt(amplitude ** 2 - self.hysteresis ** 2)
+        return 4 * d / (pi * amplitude), period
+
+    def get_pid_parameters(self, rule="ziegler-nichols"):
+        ku, pu = self.ultimate()
+        kp, ki, kd = self.RULES[rule]
+        return PIDParams(kp * ku, ki * ku / pu, kd * ku * pu)
+
+    def report(self):
+        doc = {
+            "state": self.state,
+            "setpoint": self.setpoint,
+            "cycles": self.cycles(),
+            "elapsed": round(self.elapsed),
+            "confidence": round(self.confidence(), 3),
+        }
+        if self.cycles():
+            doc["amplitude"] = round(self.amplitudes[-1], 3)
+            doc["period"] = round(self.periods[-1], 1)
+        return doc
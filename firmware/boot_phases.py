@@ -0,0 +1,9 @@
+from utime import ticks_ms
+
+# (phase, ticks_ms when it ended), ticks_ms counting from reset.
+phases = []
+
+
+def mark(name):
+    """Note that boot phase name is done."""
+    phases.append((name, ticks_ms()))
@@ -0,0 +1,99 @@
+import json
+import os
+
+import uasyncio as asyncio
+import ulogging as logging
+from utime import ticks_diff, ticks_ms
+
+import taskprof
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigStore:
+    """
+    Dict-like config persisted to flash by a background task.
+
+    Setting a key marks the store dirty; once no change has been made for
+    `quiet_ms` the whole config is written to a temporary file which is then
+    renamed over the real one, so a power cut leaves either the old or the
+    new config, never half of one.  A failed write is retried after
+    another quiet period.
+    """
+
+    def __init__(self, filename, defaults, quiet_ms=2000):
+        self.filename = filename
+        self.quiet_ms = quiet_ms
+        self._data = dict(defaults)
+        self._dirty = False
+        self._changed = 0
+        self._event = asyncio.Event()
+        self.writes = 0
+        self.load()
+        taskprof.create_task("config_store", self._writer())
+
+    def load(self):
+        # the temp file is only left complete if we lost power mid-rename.
+        for fn in (self.filename, self.filename + ".tmp"):
+            try:
+                with open(fn) as f:
+                    self._data.update(json.load(f))
+                return
+            except (OSError, ValueError):
+                pass
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, val):
+        if self._data.get(key) != val:
+            self._data[key] = val
+            self.touch()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def update(self, vals):
+        for key, val in vals.items():
+            self[key] = val
+
+    def touch(self):
+        """Mark dirty, restarting the quiet period."""
+        self._dirty = True
+        self._changed = ticks_ms()
+        self._event.set()
+
+    def flush(self):
+        """Write now if dirty, staying dirty if the write fails."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        tmp = self.filename + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(json.dumps(self._data))
+            try:
+                os.rename(tmp, self.filename)
+            except OSError:
+                # not every filesystem will rename over an existing file.
+                os.remove(self.filename)
+                os.rename(tmp, self.filename)
+        except OSError:
+            self._dirty = True
+            raise
+        self.writes += 1
+
+    async def _writer(self):
+        while True:
+            await self._event.wait()
+            self._event.clear()
+            while (quiet := ticks_diff(ticks_ms(), self._changed)) < self.quiet_ms:
+                await asyncio.sleep_ms(self.quiet_ms - quiet)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.error("Writing %s failed: %s", self.filename, e)
+                self.touch()
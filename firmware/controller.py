@@ -4,167 +4,452 @@ import uasyncio as asyncio
 import ulogging as logging
 
 import hal
-from autotune import PIDAutotune
+import memstats
+import taskprof
+from autotune import CANCELLED, CONVERGED, RelayAutotune
+from display import MENU
+from gain_schedule import GainSchedule
+from program import Program
 
 logger = logging.getLogger(__name__)
-heat_enabled = False
 
-autotuner = PIDAutotune(60, 1023, out_min=0, out_max=1023, time=time.time)
-tuned = False
+IDLE = "idle"
+HEATING = "heating"
+HOLDING = "holding"
+AUTOTUNING = "autotuning"
+MANUAL = "manual"
+RUNNING = (HEATING, HOLDING)
+
+state = IDLE
+# pulsed whenever state or setpoint changes, or the sensor comes or goes.
+changed = asyncio.Event()
+# give up on the sensor and switch off if no reading comes for this long.
+STALE_MS = 5000
+# within this many degrees of setpoint we are holding rather than heating.
+HOLD_BAND = 0.5
+beep_on_hold = False
+# set by a new setpoint, switching on or falling twice ramp_band below
+# setpoint, until we first get within ramp_band.
+ramping = False
+
+gains = GainSchedule(hal.config["gain_schedule"], hal.config["gain_band"])
+
+autotuner = RelayAutotune(out_min=0, out_max=1023)
 generated_params = []
+# counts autotune runs, so that a run moved aside notices a newer one.
+tune_runs = 0
+
+# the cook program last started, and whether it is moving the setpoint.
+program = None
+tracking = False
+
+# ticks_ms of the last pass of the heat loop, which makes one at least every
+# STALE_MS.
+heartbeat = time.ticks_ms()
+# PID updates, and the age of the sample each acted on.
+updates = 0
+latency_ms = 0
+latency_max_ms = 0
+
+
+def enabled():
+    """Whether the controller is driving the heater."""
+    return state in RUNNING
+
+
+def set_state(new):
+    """Enter a new state, waking the heat loop."""
+    global state
+    global ramping
+    if new != state:
+        logger.info("%s -> %s", state, new)
+        if state == AUTOTUNING and autotuner.running():
+            # whoever moves us on takes over the heater.
+            autotuner.cancel()
+        if new in RUNNING and state not in RUNNING:
+            ramping = True
+        state = new
+        # so that we carry on where we left off after a reset.
+        hal.config["running"] = new in RUNNING
+    hal.pulse(changed)
+
+
+def set_setpoint(val):
+    """Change setpoint, taking effect at once."""
+    global ramping
+    hal.pid.setpoint = val
+    hal.config["setpoint"] = val
+    apply_gains()
+    ramping = True
+    hal.pulse(changed)
+
+
+def apply_gains():
+    """Set the PID gains for the setpoint from the schedule, if there is one."""
+    tunings = gains.gains(hal.pid.setpoint)
+    if tunings is None:
+        tunings = (hal.config["Kp"], hal.config["Ki"], hal.config["Kd"])
+    if tunings != hal.pid.tunings:
+        logger.info("gains at %s now %s", hal.pid.setpoint, tunings)
+        hal.pid.tunings = tunings
+
+
+def file_gains(setpoint, kp, ki, kd):
+    """File gains under setpoint's band and apply them if they now matter."""
+    gains.file(setpoint, kp, ki, kd)
+    # the schedule is kept in the config, so changing it in place needs a touch.
+    hal.config.touch()
+    apply_gains()
+
+
+def set_gain(name, val):
+    """
+    Set one of Kp, Ki and Kd by hand.
+
+    With a gain schedule the gains come from it, so the gains now in use are
+    filed for the setpoint with the new one in place; otherwise it is the
+    flat gain in the config which changes.
+    """
+    tunings = gains.gains(hal.pid.setpoint)
+    if tunings is None:
+        hal.config[name] = val
+        apply_gains()
+        return
+    tunings = list(tunings)
+    tunings[("Kp", "Ki", "Kd").index(name)] = val
+    file_gains(hal.pid.setpoint, *tunings)
 
 
 async def autotune_loop(temp):
-    global heat_enabled
+    """
+    Relay autotune about temp, stepped on every fresh reading.
+
+    Stops as soon as the oscillation has converged, then restores the state
+    we started in.  Leaving AUTOTUNING any other way cancels the run, and
+    the heater is then left to whoever moved the state on.
+    """
     global generated_params
-    global tuned
-    tuned = False
+    global tune_runs
     generated_params = []
-    before = heat_enabled
-    heat_enabled = False
-    tuned = False
-    autotuner._setpoint = temp
+    before = state
+    set_state(AUTOTUNING)
+    autotuner.start(temp)
+    tune_runs += 1
+    run = tune_runs
+    start = time.ticks_ms()
     logger.info("Starting autotune loop")
-    while not tuned:
-        tuned = autotuner.run(hal.temp)
-        state = autotuner.state
-        hal.relay.duty(int(autotuner.output))
-        await asyncio.sleep(5)
-        if (s := autotuner.state) != state:
-            logger.info(s)
-    hal.relay.duty(0)
-    heat_enabled = before
-    if tuned == "cancelled":
-        logger.info("Cancelling autotune")
+    while autotuner.running():
+        if state != AUTOTUNING or tune_runs != run:
+            break
+        hal.relay.duty(autotuner.output)
+        try:
+            await asyncio.wait_for_ms(hal.temp_event.wait(), STALE_MS)
+        except asyncio.TimeoutError:
+            logger.error("No reading for %s ms, cancelling autotune", STALE_MS)
+            autotuner.cancel()
+            break
+        if not hal.roms:
+            logger.error("Sensor lost, cancelling autotune")
+            autotuner.cancel()
+        if not autotuner.running() or tune_runs != run:
+            break
+        cycles = autotuner.cycles()
+        autotuner.run(hal.temp, time.ticks_diff(time.ticks_ms(), start) / 1000)
+        if autotuner.cycles() != cycles:
+            logger.info("autotune: %s", autotuner.report())
+    if tune_runs != run:
+        # a newer run has the tuner and the heater.
+        return
+    if state == AUTOTUNING:
+        hal.relay.duty(0)
+        set_state(before)
+    logger.info("autotune %s", autotuner.report())
+    if autotuner.state == CANCELLED:
         return
     _params = []
     for rule in autotuner.tuning_rules:
         params = autotuner.get_pid_parameters(rule)
-        logger.info("rule {} yielded {}".format(rule, params))
+        logger.info("rule %s yielded %s", rule, params)
         _params.append(params)
     generated_params = _params
-    assert generated_params, "Params not populated for some reason."
+    if autotuner.state == CONVERGED:
+        file_gains(temp, *autotuner.get_pid_parameters(hal.config["autotune_rule"]))
 
 
 def autotune(temp):
-    asyncio.get_event_loop().create_task(autotune_loop(temp))
+    taskprof.create_task("autotune", autotune_loop(temp))
+
+
+def cancel_autotune():
+    autotuner.cancel()
+
+
+async def program_loop(prog):
+    """
+    Run a cook program, stepped on every fresh reading.
+
+    Ramps move the setpoint on every reading, so the PID tracks a moving
+    target rather than a step.  Holds only start once the bath is holding at
+    the setpoint, and count down on alarm 0 so the countdown shows as usual.
+    Switching off or changing the setpoint from elsewhere stops the program.
+    """
+    global beep_on_hold
+    global tracking
+    beep_on_hold = False
+    if not enabled():
+        set_state(HEATING)
+    ours = hal.pid.setpoint
+    while prog.running():
+        if not enabled() or hal.pid.setpoint != ours:
+            logger.info("Program stopped at step %d", prog.index)
+            prog.stop()
+            break
+        if hal.roms and hal.temp is not None:
+            _program_step(prog)
+            ours = hal.pid.setpoint
+        if not prog.running():
+            break
+        try:
+            await asyncio.wait_for_ms(hal.temp_event.wait(), STALE_MS)
+        except asyncio.TimeoutError:
+            pass
+    # unless a new program has taken over in the meantime.
+    if program is prog:
+        tracking = False
+        if prog.hold_left(time.ticks_ms()) is not None:
+            hal.rtc.cancel(0)
+    logger.info("Program %s", prog.state)
+
+
+def _program_step(prog):
+    """Carry out the current program step, moving on past any finished."""
+    global tracking
+    now = time.ticks_ms()
+    while prog.running():
+        step = prog.step()
+        if "ramp" in step:
+            setpoint = prog.setpoint(now, hal.temp)
+            if setpoint != step["ramp"]:
+                tracking = True
+                hal.pid.setpoint = setpoint
+                return
+            tracking = False
+            set_setpoint(setpoint)
+        elif "hold" in step:
+            if prog.hold_left(now) is None:
+                if state != HOLDING:
+                    return
+                prog.start_hold(now)
+                hal.rtc.cancel(0)
+                hal.rtc.alarm(0, step["hold"])
+            if prog.hold_left(now):
+                return
+            hal.rtc.cancel(0)
+        elif "alarm" in step:
+            taskprof.create_task("sound", hal.sound(0))
+        else:
+            stop_controller()
+        logger.info("Program step %d done", prog.index)
+        prog.next()
+
+
+def start_program(steps):
+    """Start a cook program from a list of steps, replacing any running one."""
+    global program
+    prog = Program(steps)
+    stop_program()
+    program = prog
+    taskprof.create_task("program", program_loop(prog))
+
+
+def stop_program():
+    if program is not None:
+        program.stop()
 
 
 async def set_param(
-    name_, param, max_, min_, step=0.1, timeout=1000, len_=3, formatstr="{0: >3}*"
+    name_, param, max_, min_, step=0.1, timeout=10000, len_=3, formatstr="{0: >3}*"
 ):
     """
     Set a parameter using the rotary encoder.
 
-    Click to exit.  Times out after timeout ms.
+    Click to exit.  Times out after timeout ms without a turn.
     """
-    hal.display_lock = True
     if name_:
-        hal.disp.show(name_)
+        hal.disp.show("menu", name_, MENU)
         await asyncio.sleep(0.5)
 
     old_fns = hal.save_button_fns()
 
-    inactive_ms = 0
     hal.button.release_func(hal.set_push_flag)
     hal.button.double_func(hal.set_double_flag)
     hal.encoder.position = param / step
+    shown = None
 
-    while (inactive_ms < timeout) and not hal.push_flag:
+    while True:
+        # a turn sets the flag until the next wait, so none is missed.
+        if hal.push_flag:
+            break
         val = hal.encoder.position * step
         hal.encoder.position = max(min_, min(val, max_)) / step
         val = hal.encoder.position * step
-        disp_val = str(val)[: len_ + 1] if "." in str(val) else str(val)[:len_]
-        hal.disp.show(formatstr.format(disp_val))
-        await asyncio.sleep(0.1)
+        if val != shown:
+            shown = val
+            disp_val = str(val)[: len_ + 1] if "." in str(val) else str(val)[:len_]
+            hal.disp.show("menu", formatstr.format(disp_val), MENU)
+        try:
+            await asyncio.wait_for_ms(hal.encoder.flag.wait(), timeout)
+        except asyncio.TimeoutError:
+            break
 
     hal.push_flag = False
-    await flash_disp()
+    await hal.disp.flash()
     hal.restore_button_fns(old_fns)
 
-    hal.display_lock = False
+    hal.disp.remove("menu")
     return val
 
 
-async def flash_disp():
-    brightness = hal.disp.brightness()
-    for _ in range(2):
-        hal.disp.brightness(0)
-        await asyncio.sleep(0.1)
-        hal.disp.brightness(brightness)
-        await asyncio.sleep(0.1)
+def _update_hold():
+    """Move between heating and holding as the bath nears setpoint."""
+    global beep_on_hold
+    error = abs(hal.pid.setpoint - hal.temp)
+    if state == HEATING and error <= HOLD_BAND:
+        set_state(HOLDING)
+        if beep_on_hold:
+            beep_on_hold = False
+            taskprof.create_task("sound", hal.sound())
+    elif state == HOLDING and error > 2 * HOLD_BAND:
+        set_state(HEATING)
+
+
+def _control(dt):
+    """One control update, dt s after the last, returning the duty to apply."""
+    global ramping
+    setpoint = hal.pid.setpoint
+    band = hal.config["ramp_band"]
+    if setpoint - hal.temp > 2 * band and not ramping:
+        ramping = True
+    if ramping and setpoint - hal.temp > band:
+        if hal.config["windup_clamp"]:
+            # Far below setpoint: run flat out, keeping the integral at zero
+            # so that it has not wound up by the time we get there.
+            hal.pid.reset()
+            return 1023
+    else:
+        ramping = False
+    return round(hal.pid(hal.temp, dt))
 
 
 async def heat_loop():
-    global heat_enabled
-    while not hal.temp:
-        await asyncio.sleep(1)
-    while True:
-        if heat_enabled and hal.rom:
-            hal.pid.set_auto_mode(True)
-        while heat_enabled and hal.rom:
-            _duty = hal.relay.duty()
-            val = round(hal.pid(hal.temp))
-            if val != _duty:
-                logger.debug("pid yields: {}".format(val))
-                logger.debug(hal.pid.components)
-            hal.relay.duty(val)
-            await asyncio.sleep(10)
-        hal.pid.set_auto_mode(False)
-        hal.relay.duty(0)
-        while not heat_enabled:
-            await asyncio.sleep(0.1)
-
+    """
+    Drive the heater from the PID while heating or holding.
 
-async def beep_at_temperature():
-    direction = -1 if hal.temp > hal.pid.setpoint else 1
-    while (hal.pid.setpoint - hal.temp) * direction > 0:
-        await asyncio.sleep(15)
-    await hal.sound()
+    The PID is updated on every `pid_decimation`-th fresh sample from
+    `hal.temp_loop`, with the time between those samples as dt, so it never
+    acts twice on one reading.  Otherwise sleep until something changes,
+    passing by every STALE_MS to show the watchdog it is alive.
+    """
+    global heartbeat
+    running = False
+    seq = ticks = None
+    while True:
+        heartbeat = time.ticks_ms()
+        if enabled() and hal.roms and hal.temp is not None:
+            if not hal.pid.auto_mode:
+                hal.pid.set_auto_mode(True)
+                seq = ticks = None
+            running = True
+            if seq is None or hal.temp_seq - seq >= hal.config["pid_decimation"]:
+                dt = None
+                if ticks is not None:
+                    dt = time.ticks_diff(hal.temp_ticks, ticks) / 1000
+                seq, ticks = hal.temp_seq, hal.temp_ticks
+                _update(dt)
+            try:
+                await asyncio.wait_for_ms(hal.temp_event.wait(), STALE_MS)
+            except asyncio.TimeoutError:
+                logger.error("No reading for %s ms", STALE_MS)
+                hal.relay.duty(0)
+        else:
+            if running:
+                hal.pid.set_auto_mode(False)
+                running = False
+                if state not in (MANUAL, AUTOTUNING):
+                    hal.relay.duty(0)
+            try:
+                await asyncio.wait_for_ms(changed.wait(), STALE_MS)
+            except asyncio.TimeoutError:
+                pass
+
+
+def _update(dt):
+    """Apply one PID update and account for it."""
+    global updates
+    global latency_ms
+    global latency_max_ms
+    start = memstats.alloc_start()
+    _duty = hal.relay.duty()
+    val = _control(dt)
+    if val != _duty:
+        logger.debug("pid yields: %s", val)
+        logger.debug("pid components: %s", hal.pid.components)
+    hal.relay.duty(val)
+    updates += 1
+    latency_ms = time.ticks_diff(time.ticks_ms(), hal.temp_ticks)
+    latency_max_ms = max(latency_max_ms, latency_ms)
+    _update_hold()
+    memstats.alloc_end("heat_loop", start)
+
+
+async def watch_sensor():
+    """Pass sensor connection changes on to the heat loop."""
+    while True:
+        await hal.status_event.wait()
+        hal.pulse(changed)
 
 
 async def _manual_start_controller():
-    global heat_enabled
     hal.encoder.position = hal.temp * 10
-    hal.pid.setpoint = await set_param("set ", 75, 100, 30)
-    hal.config["setpoint"] = hal.pid.setpoint
-    hal.persist_config()
-    heat_enabled = True
+    set_setpoint(await set_param("set ", 75, 100, 30))
+    set_state(HEATING)
 
 
 def manual_start_controller(loop):
-    loop.create_task(_manual_start_controller())
+    taskprof.create_task("menu", _manual_start_controller())
 
 
 def start_controller():
-    global heat_enabled
-    heat_enabled = True
-    hal.pid.auto_mode = True
-    asyncio.get_event_loop().create_task(beep_at_temperature())
+    global beep_on_hold
+    beep_on_hold = True
+    set_state(HEATING)
 
 
 def stop_controller():
-    global heat_enabled
-    heat_enabled = False
     hal.relay.duty(0)
     hal.pid.auto_mode = False
     hal.pid.reset()
+    set_state(IDLE)
+
+
+def manual(duty):
+    """Drive the heater at a fixed duty, bypassing the PID."""
+    stop_controller()
+    hal.relay.duty(duty)
+    set_state(MANUAL)
 
 
 async def _toggle():
-    global heat_enabled
-    heat_enabled = False if heat_enabled else True
-    if not heat_enabled:
-        hal.relay.duty(0)
-    before = hal.display_lock
-    hal.display_lock = True
-    hal.disp.show("On  " if heat_enabled else "Off ")
-    await flash_disp()
-    hal.display_lock = before
+    if enabled():
+        stop_controller()
+    else:
+        set_state(HEATING)
+    hal.disp.show("menu", "On  " if enabled() else "Off ", MENU, 1000)
+    await hal.disp.flash()
 
 
 def manual_toggle(loop):
-    loop.create_task(_toggle())
+    taskprof.create_task("menu", _toggle())
 
 
 async def _manual_start_countdown():
@@ -179,7 +464,7 @@ async def _manual_start_countdown():
 
 
 def manual_start_countdown(loop):
-    loop.create_task(_manual_start_countdown())
+    taskprof.create_task("menu", _manual_start_countdown())
 
 
 def start_countdown(secs):
@@ -192,5 +477,25 @@ def stop_countdown():
     hal.rtc.cancel(0)
 
 
+async def history_loop():
+    """Record telemetry to `hal.history` every history_interval seconds."""
+    while True:
+        if hal.temp is not None:
+            hal.history.record(
+                time.time(),
+                hal.temp,
+                hal.relay.duty(),
+                hal.pid.setpoint,
+                hal.pid.components,
+            )
+        await asyncio.sleep(hal.config["history_interval"])
+
+
 def init(loop):
-    loop.create_task(heat_loop())
+    apply_gains()
+    if hal.config["running"]:
+        logger.info("Resuming at %s", hal.pid.setpoint)
+        set_state(HEATING)
+    taskprof.create_task("heat_loop", heat_loop())
+    taskprof.create_task("watch_sensor", watch_sensor())
+    taskprof.create_task("history_loop", history_loop())
@@ -0,0 +1,134 @@
+import uasyncio as asyncio
+import ulogging as logging
+from utime import ticks_add, ticks_diff, ticks_ms
+
+import taskprof
+
+logger = logging.getLogger(__name__)
+
+# screen priorities: the highest live screen is shown.
+TEMPERATURE = 0
+COUNTDOWN = 1
+MENU = 2
+ALERT = 3
+
+# how often screens with a function for content are re-rendered.
+REFRESH_MS = 250
+
+
+class Display:
+    """
+    Compositor owning a TM1637.
+
+    Screens are submitted by name with a priority and optionally a duration
+    in ms, after which they are dropped.  The highest priority screen is
+    shown, the most recently submitted winning ties.  Content is a string,
+    or a function returning one which is called every REFRESH_MS while its
+    screen is on top; a function returning None or raising drops its
+    screen.  The segments last sent are kept as a 4 byte frame,
+    and the display is only written when the frame changes.
+    """
+
+    def __init__(self, tm):
+        self.tm = tm
+        self._screens = {}
+        self._seq = 0
+        self._text = None
+        self._frame = bytearray(4)
+        self._brightness = tm.brightness()
+        self._event = asyncio.Event()
+        self.writes = 0
+        taskprof.create_task("display", self._loop())
+
+    def show(self, name, content, priority=TEMPERATURE, ms=None):
+        """Submit or replace screen name."""
+        expires = None if ms is None else ticks_add(ticks_ms(), ms)
+        self._seq += 1
+        self._screens[name] = (priority, self._seq, content, expires)
+        self.refresh()
+
+    def remove(self, name):
+        if self._screens.pop(name, None):
+            self.refresh()
+
+    def brightness(self, val=None):
+        if val is None:
+            return self._brightness
+        if val != self._brightness:
+            # the driver may refuse val, which must not be kept then.
+            self.tm.brightness(val)
+            self._brightness = val
+
+    async def flash(self, times=2):
+        for _ in range(times):
+            self.tm.brightness(0)
+            await asyncio.sleep_ms(100)
+            self.tm.brightness(self._brightness)
+            await asyncio.sleep_ms(100)
+
+    def _top(self):
+        """Name of the screen to show, dropping any which have expired."""
+        now = ticks_ms()
+        top = None
+        for name in [
+            name
+            for name, screen in self._screens.items()
+            if screen[3] is not None and ticks_diff(screen[3], now) <= 0
+        ]:
+            del self._screens[name]
+        for name, screen in self._screens.items():
+            if top is None or screen[:2] > self._screens[top][:2]:
+                top = name
+        return top
+
+    def _render(self):
+        """Text of the top screen, dropping screens whose function fails."""
+        while True:
+            top = self._top()
+            if top is None:
+                return ""
+            content = self._screens[top][2]
+            if not callable(content):
+                return content
+            try:
+                text = content()
+            except Exception as e:
+                logger.error("Screen %s raised %s", top, e)
+                text = None
+            if text is not None:
+                return text
+            del self._screens[top]
+
+    def refresh(self):
+        """Render the top screen, writing the display if the frame changed."""
+        self._event.set()
+        text = self._render()
+        if text == self._text:
+            return
+        self._text = text
+        segments = self.tm.encode_string(text)
+        changed = False
+        for i in range(4):
+            seg = segments[i] if i < len(segments) else 0
+            if self._frame[i] != seg:
+                self._frame[i] = seg
+                changed = True
+        if changed:
+            self.tm.write(self._frame)
+            self.writes += 1
+
+    async def _loop(self):
+        while True:
+            self._event.clear()
+            # only functions and expiring screens need rendering unprompted.
+            if any(
+                callable(screen[2]) or screen[3] is not None
+                for screen in self._screens.values()
+            ):
+                try:
+                    await asyncio.wait_for_ms(self._event.wait(), REFRESH_MS)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await self._event.wait()
+            self.refresh()
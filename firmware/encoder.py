@@ -0,0 +1,108 @@
+from array import array
+
+import micropython
+import uasyncio as asyncio
+from machine import Pin
+from utime import ticks_diff, ticks_ms
+
+# steps within ACCEL_WINDOW_MS of each other: multiplier, fastest first.
+ACCEL_WINDOW_MS = 200
+ACCEL = ((16, 10), (8, 4))
+
+
+class Encoder:
+    """
+    Quadrature encoder with velocity acceleration.
+
+    The pin ISRs only record timestamped steps in a ring buffer and set
+    `flag`, a ThreadSafeFlag, which is safe from interrupt context where an
+    Event is not.  The steps are applied to the position outside interrupt
+    context whenever it is read.  Each step counts `mult` times, where `mult`
+    grows with the number of steps in the same direction during the last
+    ACCEL_WINDOW_MS, so spinning the knob covers a wide range quickly while
+    slow turns still move one step at a time.
+    """
+
+    SIZE = 32  # power of two
+
+    def __init__(self, pin_x, pin_y, reverse, scale):
+        self.reverse = reverse
+        self.scale = scale
+        self.pin_x = pin_x
+        self.pin_y = pin_y
+        self._pos = 0
+        self.flag = asyncio.ThreadSafeFlag()
+        self.overflows = 0
+        self._ticks = array("l", (0 for _ in range(self.SIZE)))
+        self._steps = array("b", (0 for _ in range(self.SIZE)))
+        self._head = 0
+        self._tail = 0
+        # timestamps of recent steps in the current direction, for velocity.
+        self._recent = array("l", (0 for _ in range(ACCEL[0][0])))
+        self._recent_n = 0
+        self._dir = 0
+        self.x_interrupt = pin_x.irq(
+            handler=self.x_callback, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING
+        )
+        self.y_interrupt = pin_y.irq(
+            handler=self.y_callback, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING
+        )
+
+    @micropython.native
+    def _record(self, step):
+        head = self._head
+        nxt = (head + 1) & (self.SIZE - 1)
+        if nxt == self._tail:
+            self.overflows += 1
+            return
+        self._ticks[head] = ticks_ms()
+        self._steps[head] = step
+        self._head = nxt
+        self.flag.set()
+
+    @micropython.native
+    def x_callback(self, line):
+        forward = self.pin_x.value() ^ self.pin_y.value() ^ self.reverse
+        self._record(1 if forward else -1)
+
+    @micropython.native
+    def y_callback(self, line):
+        forward = self.pin_x.value() ^ self.pin_y.value() ^ self.reverse ^ 1
+        self._record(1 if forward else -1)
+
+    def _mult(self, t, step):
+        """Multiplier for a step at t, noting it for later ones."""
+        if step != self._dir:
+            self._dir = step
+            self._recent_n = 0
+        size = len(self._recent)
+        self._recent[self._recent_n % size] = t
+        self._recent_n += 1
+        n = 0
+        for i in range(min(self._recent_n, size)):
+            if ticks_diff(t, self._recent[i]) < ACCEL_WINDOW_MS:
+                n += 1
+        for steps, mult in ACCEL:
+            if n >= steps:
+                return mult
+        return 1
+
+    def _drain(self):
+        """Apply the queued steps; only the ISRs move the head, only we the tail."""
+        while self._tail != self._head:
+            tail = self._tail
+            step = self._steps[tail]
+            self._pos += step * self._mult(self._ticks[tail], step)
+            self._tail = (tail + 1) & (self.SIZE - 1)
+
+    @property
+    def position(self):
+        self._drain()
+        return self._pos * self.scale
+
+    @position.setter
+    def position(self, pos):
+        self._pos = round(pos / self.scale)
+
+    def reset(self):
+        self._pos = 0
@@ -0,0 +1,42 @@
+class GainSchedule:
+    """
+    PID gains by setpoint band.
+
+    `rows` is a list of [setpoint, Kp, Ki, Kd], sorted by setpoint, with at
+    most one row per `band` degrees: gains filed for a setpoint replace any
+    row in the same band.  Rows keep the setpoint the gains were found at,
+    and gains between rows are interpolated linearly from there.  Outside
+    them the nearest row is used.
+    """
+
+    def __init__(self, rows, band=10):
+        self.rows = rows
+        self.band = band
+        self.rows.sort()
+
+    def band_of(self, setpoint):
+        """Centre of the band setpoint lies in."""
+        return round(setpoint / self.band) * self.band
+
+    def file(self, setpoint, kp, ki, kd):
+        """File gains measured at setpoint, replacing any row in its band."""
+        self.remove(setpoint)
+        self.rows.append([setpoint, kp, ki, kd])
+        self.rows.sort()
+
+    def remove(self, setpoint):
+        key = self.band_of(setpoint)
+        self.rows[:] = [r for r in self.rows if self.band_of(r[0]) != key]
+
+    def gains(self, setpoint):
+        """(Kp, Ki, Kd) for setpoint, or None if the schedule is empty."""
+        rows = self.rows
+        if not rows:
+            return None
+        if setpoint <= rows[0][0]:
+            return tuple(rows[0][1:])
+        for lo, hi in zip(rows, rows[1:]):
+            if setpoint <= hi[0]:
+                frac = (setpoint - lo[0]) / (hi[0] - lo[0])
+                return tuple(a + frac * (b - a) for a, b in zip(lo[1:], hi[1:]))
+        return tuple(rows[-1][1:])
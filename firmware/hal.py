@@ -1,34 +1,60 @@
-import json
+from array import array
 
 import ds18x20
-import micropython
 import onewire
+import ubinascii
 import uasyncio as asyncio
 import ulogging as logging
 from machine import PWM, Pin
+from utime import ticks_add, ticks_diff, ticks_ms
 
+import memstats
 import PID
+import taskprof
 import tm1637
 from alarm_rtc import AlarmRTC
+from config_store import ConfigStore
+from display import ALERT, Display
+from encoder import Encoder
+from history import History
+from softpwm import softPWM
 from primitives.pushbutton import Pushbutton
 
 logger = logging.getLogger(__name__)
-config = {"Kp": 1, "Ki": 0.5, "Kd": 0.5, "brightness": 6, "setpoint": 75, "freq": 0.005}
-try:
-    with open("config.json") as f:
-        config.update(json.load(f))
-except OSError:
-    pass
+config = ConfigStore(
+    "config.json",
+    {
+        "Kp": 1,
+        "Ki": 0.5,
+        "Kd": 0.5,
+        "brightness": 6,
+        "setpoint": 75,
+        "freq": 0.005,
+        "resolution": 12,
+        "fusion": "mean",
+        "history_size": 512,
+        "history_interval": 30,
+        "windup_clamp": False,
+        "ramp_band": 2.0,
+        "gain_schedule": [],
+        "gain_band": 10,
+        "autotune_rule": "tyreus-luyben",
+        "pid_decimation": 4,
+        "running": False,
+        "profile_tasks": False,
+        "watchdog_ms": 8000,
+        "stall_ms": 250,
+        "telemetry_host": "",
+        "telemetry_port": 5005,
+        "telemetry_ms": 1000,
+    },
+)
+taskprof.enable(config["profile_tasks"])
 
 avg = 15
 temp_reset = False
 
 
-def persist_config():
-    with open("config.json", "w") as f:
-        f.write(json.dumps(config))
-
-
 class settablePin(Pin):
     @property
     def val(self):
@@ -39,51 +65,17 @@ class settablePin(Pin):
         self.value(value ^ 1)
 
 
-display_lock = False
-
-relay_pin = Pin(13, Pin.OUT)
+# pulsed when a sensor is connected or lost.
+status_event = asyncio.Event()
 
 
-class softPWM:
-    def __init__(self, pin, freq=0.005, duty=0):
-        self.pin = pin
-        self.pin.off()
-        self._duty = duty
-        self._period = None
-        self.freq(freq)
-        self._reset = False
-        asyncio.get_event_loop().create_task(self._loop())
-
-    def freq(self, f=None):
-        if f:
-            self._period = round(1000 / (f * 1023))
-            self._reset = True
-        return 1023000 / self._period
-
-    def duty(self, d=None):
-        if d is not None:
-            if d < 0 or d > 1023:
-                raise Exception("Duty must be between 0 and 1023")
-            old_duty = self._duty
-            self._duty = d
-            if self._duty != old_duty:
-                self._reset = True
-        return self._duty
-
-    async def _loop(self):
-        count = 0
-        while True:
-            if count == self._duty:
-                self.pin.off()
-            count += 1
-            if count > 1023 or self._reset:
-                self._reset = False
-                count = 0
-                if self._duty:
-                    self.pin.on()
-            await asyncio.sleep_ms(self._period)
+def pulse(event):
+    """Wake everything waiting on event without leaving it set."""
+    event.set()
+    event.clear()
 
 
+relay_pin = Pin(13, Pin.OUT)
 relay = softPWM(relay_pin, freq=config["freq"], duty=0)
 period = relay._period
 buzzer = PWM(Pin(12), duty=0, freq=440)
@@ -119,6 +111,8 @@ async def sound(alarm_id=None):
     button.double_func(stop_alarm)
     button.long_func(stop_alarm)
     button.release_func(stop_alarm)
+    # sounded for the countdown, or on reaching temperature.
+    disp.show("alarm", "End " if alarm_id is not None else "rdy ", ALERT)
     duty = 16
     while alarm_flag:
         if duty < 512:
@@ -129,6 +123,7 @@ async def sound(alarm_id=None):
             buzzer.duty(0)
             await asyncio.sleep_ms(50)
         await asyncio.sleep(1)
+    disp.remove("alarm")
     restore_button_fns(old_fns)
     if alarm_id is not None:
         rtc.cancel(alarm_id)
@@ -144,65 +139,166 @@ digits = (18, 22, 21, 19)
 sensor = Pin(15)
 ow = onewire.OneWire(sensor)
 ds = ds18x20.DS18X20(ow)
-rom = None
+roms = []
+probe_ids = []
+probe_temps = array("f")
 temp = None
+temp_seq = 0
+temp_ticks = None
+temp_event = asyncio.Event()
+# conversion time in ms for 9, 10, 11 and 12 bit resolution.
+CONVERSION_MS = (94, 188, 375, 750)
+resolution = config["resolution"]
+FUSIONS = ("mean", "median", "min", "max")
+fusion = config["fusion"]
 
 
-def detect_sensor():
+def detect_sensors():
     """
-    Detect sensor if attached.
+    Detect sensors attached to the bus.
 
-    Returns rom if present else None.
+    Returns a list of roms, empty if none are present.
     """
     try:
-        roms = ds.scan()
+        return ds.scan()
     except Exception as e:
-        logger.debug("detect_sensor raised exception {}".format(e))
-        return None
-    no_roms = len(roms)
-    if no_roms > 1:
-        logger.debug("detected {} sensors attached; aborting".format(no_roms))
-    if no_roms != 1:
-        return None
-    else:
-        return roms[0]
+        logger.debug("detect_sensors raised exception %s", e)
+        return []
 
 
-async def read_sensor(rom):
-    """Read sensor."""
-    ds.convert_temp()
-    await asyncio.sleep_ms(750)
-    return ds.read_temp(rom)
+def conversion_ms(bits=None):
+    """Time in ms a conversion takes at the given (or current) resolution."""
+    return CONVERSION_MS[(bits or resolution) - 9]
+
+
+def set_resolution(bits):
+    """Set sensor resolution in bits (9-12); applied before the next conversion."""
+    global resolution
+    global temp_reset
+    if bits < 9 or bits > 12:
+        raise ValueError("Resolution must be between 9 and 12 bits")
+    resolution = bits
+    temp_reset = True
+
+
+def write_resolution(rom):
+    """Write the current resolution to the sensor, keeping the alarm bytes."""
+    scratch = ds.read_scratch(rom)
+    ds.write_scratch(
+        rom, bytearray((scratch[2], scratch[3], (resolution - 9) << 5 | 0x1F))
+    )
+
+
+def set_fusion(mode):
+    """Set how readings from several probes are combined into `temp`."""
+    global fusion
+    if mode not in FUSIONS:
+        raise ValueError("Fusion must be one of {}".format(FUSIONS))
+    fusion = mode
+
+
+def fuse(vals):
+    """Combine per-probe temperatures according to `fusion`."""
+    n = len(vals)
+    if n == 1:
+        return vals[0]
+    if fusion == "min":
+        return min(vals)
+    if fusion == "max":
+        return max(vals)
+    if fusion == "median":
+        vals = sorted(vals)
+        mid = n // 2
+        return vals[mid] if n % 2 else (vals[mid - 1] + vals[mid]) / 2
+    return sum(vals) / n
 
 
 async def temp_loop():
-    global rom
+    """
+    Acquire and average temperature from every probe on the bus.
+
+    One broadcast conversion serves all probes, and the next conversion is
+    started as soon as the results are read, so the sample period is the
+    conversion time however many probes there are.  Each probe keeps a
+    running window sum; the averages are published in `probe_temps` and fused
+    into `temp`, with `temp_seq` and `temp_ticks`, and `temp_event` is
+    pulsed.  `status_event` is pulsed when probes are lost, and when they are
+    found once the first reading is in.  Losing them pulses `temp_event` too,
+    with `roms` empty, so whatever waits on readings hears of it at once.
+    """
+    global roms
+    global probe_ids
+    global probe_temps
     global temp
     global temp_reset
-    global avg
-    temps = []
+    global temp_seq
+    global temp_ticks
     while True:
-        while not (rom := detect_sensor()):
+        while not (roms := detect_sensors()):
             logger.debug("No sensor found")
             await asyncio.sleep_ms(200)
-        try:
-            temps = [await read_sensor(rom)] * avg
-        except Exception as e:
-            logger.debug("read_sensor raised exception {}".format(e))
-            rom = None
-        i = 0
-        while rom and not temp_reset:
-            try:
-                temps[i] = await read_sensor(rom)
-                logger.debug("Got {}".format(temps[i]))
-                temp = sum(temps) / avg
-            except (onewire.OneWireError, Exception) as e:
-                logger.debug("read_sensor raised exception {}.".format(e))
-                rom = None
-            await asyncio.sleep_ms(250)
-            i += 1
-            i %= avg
+        if len(roms) > 1:
+            logger.info("%d sensors attached", len(roms))
         temp_reset = False
+        window = avg
+        n = len(roms)
+        probe_ids = [ubinascii.hexlify(rom).decode() for rom in roms]
+        probe_temps = array("f", (0 for _ in range(n)))
+        series = None
+        connected = False
+        totals = array("f", probe_temps)
+        i = 0
+        try:
+            for rom in roms:
+                write_resolution(rom)
+            conv = conversion_ms()
+            ds.convert_temp()
+            started = ticks_ms()
+            while roms and not temp_reset:
+                await asyncio.sleep_ms(
+                    max(0, ticks_diff(ticks_add(started, conv), ticks_ms()))
+                )
+                alloc = memstats.alloc_start()
+                for j, rom in enumerate(roms):
+                    probe_temps[j] = ds.read_temp(rom)
+                ds.convert_temp()
+                started = ticks_ms()
+                logger.debug("Got %s", probe_temps)
+                if series is None:
+                    series = [
+                        array("f", (reading for _ in range(window)))
+                        for reading in probe_temps
+                    ]
+                    for j in range(n):
+                        totals[j] = probe_temps[j] * window
+                    # only now is there a temperature to go with the roms.
+                    connected = True
+                else:
+                    for j in range(n):
+                        reading = probe_temps[j]
+                        totals[j] += reading - series[j][i]
+                        series[j][i] = reading
+                    i += 1
+                    if i == window:
+                        # resum once per window so rounding errors cannot build up
+                        i = 0
+                        for j in range(n):
+                            totals[j] = sum(series[j])
+                for j in range(n):
+                    probe_temps[j] = totals[j] / window
+                temp = fuse(probe_temps)
+                temp_seq += 1
+                temp_ticks = started
+                pulse(temp_event)
+                if connected:
+                    connected = False
+                    pulse(status_event)
+                memstats.alloc_end("temp_loop", alloc)
+        except (onewire.OneWireError, Exception) as e:
+            logger.debug("read_sensor raised exception %s.", e)
+            roms = []
+            pulse(status_event)
+            pulse(temp_event)
 
 
 button = Pin(23, Pin.IN, Pin.PULL_UP)
@@ -213,11 +309,13 @@ double_flag = None
 def set_push_flag():
     global push_flag
     push_flag = True
+    encoder.flag.set()
 
 
 def set_double_flag():
     global double_flag
     double_flag = True
+    encoder.flag.set()
 
 
 button = Pushbutton(button, suppress=True)
@@ -226,48 +324,9 @@ rot_left = settablePin(35, settablePin.IN, settablePin.PULL_UP)
 rot_right = settablePin(34, settablePin.IN, settablePin.PULL_UP)
 
 
-class EncoderTimed(object):
-    def __init__(self, pin_x, pin_y, reverse, scale):
-        self.reverse = reverse
-        self.scale = scale
-        self.tprev = 0
-        self.tlast = 0
-        self.forward = True
-        self.pin_x = pin_x
-        self.pin_y = pin_y
-        self._pos = 0
-        self.x_interrupt = pin_x.irq(
-            handler=self.x_callback, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING
-        )
-        self.y_interrupt = pin_y.irq(
-            handler=self.y_callback, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING
-        )
-
-    @micropython.native
-    def x_callback(self, line):
-        self.forward = self.pin_x.value() ^ self.pin_y.value() ^ self.reverse
-        self._pos += 1 if self.forward else -1
-
-    @micropython.native
-    def y_callback(self, line):
-        self.forward = self.pin_x.value() ^ self.pin_y.value() ^ self.reverse ^ 1
-        self._pos += 1 if self.forward else -1
-
-    @property
-    def position(self):
-        return self._pos * self.scale
+encoder = Encoder(rot_left, rot_right, False, 1)
 
-    @position.setter
-    def position(self, pos):
-        self._pos = round(pos / self.scale)
-
-    def reset(self):
-        self._pos = 0
-
-
-encoder = EncoderTimed(rot_left, rot_right, False, 1)
-
-disp = tm1637.TM1637Decimal(clk=Pin(16), dio=Pin(17))
+disp = Display(tm1637.TM1637Decimal(clk=Pin(16), dio=Pin(17)))
 
 pid = PID.PID(
     config["Kp"],
@@ -282,6 +341,8 @@ pid = PID.PID(
 
 rtc = AlarmRTC()
 
+history = History(config["history_size"])
+
 
 def init(loop):
-    loop.create_task(temp_loop())
+    taskprof.create_task("temp_loop", temp_loop())
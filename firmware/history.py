@@ -0,0 +1,79 @@
+from array import array
+
+
+class History:
+    """
+    Fixed size ring buffer of telemetry samples.
+
+    Each field lives in its own typed array, so recording a sample allocates
+    nothing.  Samples are addressed by a sequence number which keeps counting
+    past the end of the buffer; the oldest `size` of them are retained.
+    """
+
+    FIELDS = ("n", "t", "temp", "duty", "setpoint", "p", "i", "d")
+
+    def __init__(self, size=512):
+        self.size = size
+        self.count = 0
+        zeros = range(size)
+        self._t = array("L", (0 for _ in zeros))
+        self._duty = array("H", (0 for _ in zeros))
+        self._temp = array("f", (0 for _ in zeros))
+        self._setpoint = array("f", (0 for _ in zeros))
+        self._p = array("f", (0 for _ in zeros))
+        self._i = array("f", (0 for _ in zeros))
+        self._d = array("f", (0 for _ in zeros))
+
+    def record(self, t, temp, duty, setpoint, components):
+        """Record a sample, overwriting the oldest if full."""
+        idx = self.count % self.size
+        self._t[idx] = t
+        self._temp[idx] = temp
+        self._duty[idx] = duty
+        self._setpoint[idx] = setpoint
+        self._p[idx], self._i[idx], self._d[idx] = components
+        self.count += 1
+
+    def oldest(self):
+        """Sequence number of the oldest retained sample."""
+        return max(0, self.count - self.size)
+
+    def row(self, n):
+        """Sample n formatted as a JSON array."""
+        idx = n % self.size
+        return "[{},{},{:.2f},{},{:.2f},{:.1f},{:.1f},{:.1f}]".format(
+            n,
+            self._t[idx],
+            self._temp[idx],
+            self._duty[idx],
+            self._setpoint[idx],
+            self._p[idx],
+            self._i[idx],
+            self._d[idx],
+        )
+
+    def chunks(self, since=0, step=1, rows=16):
+        """
+        Yield the samples from `since` as a JSON document, a few rows at a time.
+
+        Only every `step`-th sample is included.  Samples overwritten while
+        the document is being consumed are skipped.  `next` is the sequence
+        number to pass as `since` to continue without missing samples.
+        """
+        end = self.count
+        yield '{{"fields":["{}"],"next":{},"rows":['.format(
+            '","'.join(self.FIELDS), end
+        )
+        buf = []
+        sep = ""
+        for n in range(max(since, self.oldest()), end, step):
+            if n < self.oldest():
+                continue
+            buf.append(self.row(n))
+            if len(buf) == rows:
+                yield sep + ",".join(buf)
+                sep = ","
+                buf = []
+        if buf:
+            yield sep + ",".join(buf)
+        yield "]}"
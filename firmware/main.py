@@ -1,21 +1,14 @@
-import uasyncio as asyncio
-import ulogging as logging
+from boot_phases import mark, phases
+
+mark("main")
+import uasyncio as asyncio  # noqa: E402
+import ulogging as logging  # noqa: E402
 from machine import reset  # noqa
-from secret import wifi_PSK, wifi_SSID
+from secret import wifi_PSK, wifi_SSID  # noqa: E402
 
 try:
     import gc
 
-    import api
-
-    gc.collect()
-    import controller
-
-    gc.collect()
-    import hal
-
-    gc.collect()
-
     logging.basicConfig(
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
         level=logging.DEBUG,
@@ -23,24 +16,71 @@ try:
     logger = logging.getLogger(__name__)
     loop = asyncio.get_event_loop()
 
+    # acquisition and control first: the web stack is loaded once they run.
+    import display
+    import hal
+    import taskprof
+
+    gc.collect()
+    hal.init(loop)
+    mark("hal")
+    import controller
+
+    gc.collect()
+    controller.init(loop)
+    import watchdog
+
+    watchdog.init(loop)
+    mark("controller")
+
     async def boot_screen():
-        hal.disp.show("ave ")
-        for _ in range(2):
-            for i in range(8):
-                hal.disp.brightness(i)
-                await asyncio.sleep_ms(50)
-            for i in range(8):
-                hal.disp.brightness(7 - i)
-                await asyncio.sleep_ms(50)
-        for i in range(hal.config["brightness"]):
+        """Fade up once, without holding anything else up."""
+        hal.disp.show("boot", "ave ", display.MENU)
+        # configs saved before brightness was limited to 7 may hold more.
+        for i in range(min(hal.config["brightness"], 7) + 1):
             hal.disp.brightness(i)
             await asyncio.sleep_ms(50)
+        hal.disp.remove("boot")
+
+    async def first_reading():
+        await hal.temp_event.wait()
+        # the sensor may have been lost rather than read.
+        while not hal.roms:
+            await hal.temp_event.wait()
+        mark("temperature")
+
+    async def temperature_screen():
+        """Show the temperature, formatting it only when it changes."""
+        shown = None
+        while True:
+            await hal.temp_event.wait()
+            if hal.temp == shown:
+                continue
+            shown = hal.temp
+            disp_temp = str(shown)[:4]
+            if "." not in disp_temp:
+                disp_temp = disp_temp[:3]
+            hal.disp.show("temperature", "{0: >3}*".format(disp_temp))
+
+    def countdown_text():
+        # gone once the countdown is stopped or silenced.
+        if 0 not in hal.rtc._alarms:
+            return None
+        t = hal.rtc.alarm_left(0)
+        if t > 3600:
+            t //= 60
+        # the point blinks once a second.
+        fmt = "{:02}.{:02}" if t % 2 else "{:02}{:02}"
+        return fmt.format(*divmod(abs(t), 60))
 
     async def set_temp_loop():
         """Test loop for setting temp."""
         for i in range(100):
-            hal.disp.show("{0: >3d}*".format(hal.encoder.position))
+            hal.disp.show(
+                "menu", "{0: >3d}*".format(hal.encoder.position), display.MENU
+            )
             await asyncio.sleep(0.1)
+        hal.disp.remove("menu")
 
     async def wifi():
         """Connect to the network."""
@@ -54,64 +94,51 @@ try:
                 wlan.connect(wifi_SSID, wifi_PSK)
                 while not wlan.isconnected():
                     await asyncio.sleep_ms(100)
-                logger.info("network config: {}".format(wlan.ifconfig()))
+                logger.info("network config: %s", wlan.ifconfig())
+                if not any(phase[0] == "wifi" for phase in phases):
+                    mark("wifi")
             else:
                 await asyncio.sleep(1)
 
     async def main():
         logger.info("Booting up")
-        hal.init(loop)
-        api.init(loop)
-        loop.create_task(wifi())
-        await boot_screen()
-        logger.info("Awaiting sensor connection.")
-        while not hal.rom:
-            await asyncio.sleep_ms(100)
-        logger.info("Sensor connected!")
-        controller.init(loop)
+        taskprof.create_task("boot_screen", boot_screen())
+        taskprof.create_task("first_reading", first_reading())
+        taskprof.create_task("temperature_screen", temperature_screen())
         hal.button.release_func(controller.manual_start_controller, args=(loop,))
         hal.button.double_func(controller.manual_start_countdown, args=(loop,))
         hal.button.long_func(controller.manual_toggle, args=(loop,))
+        # let acquisition and control start before loading the web stack.
+        await asyncio.sleep_ms(0)
+        import api
+        import memstats
+        import telemetry
 
+        gc.collect()
+        api.init(loop)
+        memstats.init(loop)
+        telemetry.init(loop)
+        taskprof.create_task("wifi", wifi())
+        mark("api")
+        for name, t in phases:
+            logger.info("boot: %s done at %d ms", name, t)
+
+        # every 5 s, show any countdown for 6 s over the temperature.
         while True:
-            if hal.rom:
-                logger.info("Sensor connected!")
-            while hal.rom and not hal.display_lock:
-                for _ in range(5):
-                    if hal.display_lock:
-                        break
-                    if not isinstance(hal.temp, float):
-                        logger.warning(
-                            "hal.temp is not float but {} ({})".format(
-                                hal.temp, type(hal.temp)
-                            )
-                        )
-                    disp_temp = str(hal.temp)[:4]
-                    if "." not in disp_temp:
-                        disp_temp = disp_temp[:3]
-                    hal.disp.show("{0: >3}*".format(disp_temp))
-                    await asyncio.sleep(1)
-                if hal.rtc._alarms:
-                    for i in range(6):
-                        if hal.display_lock:
-                            break
-                        t = hal.rtc.alarm_left(0)
-                        if t > 3600:
-                            t //= 60
-                        if i % 2:
-                            hal.disp.show("{:02}.{:02}".format(*divmod(abs(t), 60)))
-                        else:
-                            hal.disp.show("{:02}{:02}".format(*divmod(abs(t), 60)))
-                        await asyncio.sleep(1)
-            logger.info("Awaiting sensor connection.")
-            while not hal.rom or hal.display_lock:
-                await asyncio.sleep_ms(100)
+            await asyncio.sleep(5)
+            if hal.rtc._alarms:
+                hal.disp.show("countdown", countdown_text, display.COUNTDOWN, 6000)
+                await asyncio.sleep(6)
 
     gc.collect()
     gc.enable()  # likely pointless
     gc.threshold(gc.mem_free() // 4 + gc.mem_alloc())
-    loop.run_until_complete(main())
+    loop.run_until_complete(taskprof.Profiled("main", main()))
 except Exception as e:
+    # nothing drives the relay any more; an armed watchdog resets us soon.
+    import machine
+
+    machine.Pin(13, machine.Pin.OUT).off()
     # start webrepl anyhow
     import network
 
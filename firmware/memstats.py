@@ -0,0 +1,158 @@
+import gc
+import time
+from array import array
+
+import uasyncio as asyncio
+from utime import ticks_diff, ticks_ms
+
+import taskprof
+
+SAMPLE_MS = 60000
+SAMPLES = 120
+
+enabled = False
+high_water = 0
+min_free = None
+collections = 0
+auto_collections = 0
+gc_last_ms = 0
+gc_max_ms = 0
+gc_total_ms = 0
+# name: [count, total bytes, most bytes]
+allocs = {}
+
+count = 0
+_t = array("L", (0 for _ in range(SAMPLES)))
+_alloc = array("L", (0 for _ in range(SAMPLES)))
+_free = array("L", (0 for _ in range(SAMPLES)))
+_after_collect = 0
+
+
+def alloc_start():
+    """
+    Bytes allocated so far, for alloc_end, or None if not enabled.
+
+    The pair bracket a stretch of code which does not await, accounting the
+    bytes it allocates to a name.  Until `init` they do nothing, so they can
+    stay in hot paths.
+    """
+    return gc.mem_alloc() if enabled else None
+
+
+def alloc_end(name, start):
+    """Account the bytes allocated since alloc_start to name."""
+    global high_water
+    if start is None:
+        return
+    alloc = gc.mem_alloc()
+    high_water = max(high_water, alloc)
+    used = alloc - start
+    # a collection in between makes the figure meaningless.
+    if used < 0:
+        return
+    stats = allocs.get(name)
+    if stats is None:
+        stats = allocs[name] = [0, 0, 0]
+    stats[0] += 1
+    stats[1] += used
+    stats[2] = max(stats[2], used)
+
+
+def collect():
+    """Collect, timing it."""
+    global collections
+    global gc_last_ms
+    global gc_max_ms
+    global gc_total_ms
+    start = ticks_ms()
+    gc.collect()
+    gc_last_ms = ticks_diff(ticks_ms(), start)
+    gc_max_ms = max(gc_max_ms, gc_last_ms)
+    gc_total_ms += gc_last_ms
+    collections += 1
+
+
+def probe_largest():
+    """
+    Size of the largest block we can allocate, found by bisection.
+
+    Each failed allocation makes the runtime collect first, so this can hold
+    the loop up for a while on a fragmented heap: it is only run on request.
+    """
+    lo, hi = 0, gc.mem_free()
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        try:
+            bytearray(mid)
+        except MemoryError:
+            hi = mid - 1
+        else:
+            lo = mid
+    # drop the probes again.
+    gc.collect()
+    return lo
+
+
+def sample():
+    global high_water
+    global min_free
+    global auto_collections
+    global count
+    global _after_collect
+    alloc = gc.mem_alloc()
+    if alloc < _after_collect:
+        auto_collections += 1
+    high_water = max(high_water, alloc)
+    collect()
+    free = gc.mem_free()
+    min_free = free if min_free is None else min(min_free, free)
+    _after_collect = gc.mem_alloc()
+    idx = count % SAMPLES
+    _t[idx] = time.time()
+    _alloc[idx] = alloc
+    _free[idx] = free
+    count += 1
+
+
+def summary():
+    return {
+        "free": gc.mem_free(),
+        "alloc": gc.mem_alloc(),
+        "high_water": high_water,
+        "min_free": min_free,
+        "largest_free": probe_largest(),
+        "collections": collections,
+        "auto_collections": auto_collections,
+        "gc_last_ms": gc_last_ms,
+        "gc_max_ms": gc_max_ms,
+        "gc_total_ms": gc_total_ms,
+        "allocs": allocs,
+        "sample_ms": SAMPLE_MS,
+    }
+
+
+def rows():
+    """Retained samples, oldest first, as [t, alloc, free]."""
+    for n in range(max(0, count - SAMPLES), count):
+        idx = n % SAMPLES
+        yield "[{},{},{}]".format(_t[idx], _alloc[idx], _free[idx])
+
+
+async def sampler():
+    while True:
+        sample()
+        await asyncio.sleep_ms(SAMPLE_MS)
+
+
+def init(loop):
+    """
+    Enable the alloc hooks and start sampling the heap.
+
+    Every SAMPLE_MS the sampler notes the bytes allocated, runs a timed
+    collection, then notes the bytes free.  The largest free block is only
+    probed for when the summary is asked for.  A fall in allocated bytes
+    between samples means the runtime collected by itself.
+    """
+    global enabled
+    enabled = True
+    taskprof.create_task("memstats", sampler())
@@ -0,0 +1,116 @@
+from utime import ticks_add, ticks_diff
+
+RUNNING = "running"
+DONE = "done"
+STOPPED = "stopped"
+
+
+def _number(val):
+    """val as a float, if it is a number and not a bool."""
+    if isinstance(val, bool) or not isinstance(val, (int, float)):
+        raise TypeError
+    return float(val)
+
+
+class Program:
+    """
+    A cook program: steps run in order.
+
+    Each step is a dict with one of the keys
+      ramp: move the setpoint to this temperature, at `rate` C/min if given,
+        otherwise at once.
+      hold: hold for this many seconds, counted from reaching the setpoint.
+      alarm: true, to sound the alarm.
+      off: true, to switch off.
+    Steps are checked up front, so a bad program is refused whole.
+    """
+
+    def __init__(self, steps, max_steps=16):
+        if not isinstance(steps, list) or not 0 < len(steps) <= max_steps:
+            raise Exception("Expected a list of 1 to {} steps.".format(max_steps))
+        self.steps = [self.check(step) for step in steps]
+        self.index = 0
+        self.state = RUNNING
+        self._origin = None
+        self._start = None
+        self._deadline = None
+
+    @staticmethod
+    def check(step):
+        """The step with its values as numbers, raising if it is invalid."""
+        if isinstance(step, dict):
+            keys = set(step)
+            try:
+                if "ramp" in keys and keys <= {"ramp", "rate"}:
+                    checked = {
+                        "ramp": _number(step["ramp"]),
+                        "rate": _number(step.get("rate", 0)),
+                    }
+                    if 0 <= checked["ramp"] <= 100 and checked["rate"] >= 0:
+                        return checked
+                elif keys == {"hold"}:
+                    checked = {"hold": int(_number(step["hold"]))}
+                    if checked["hold"] >= 0:
+                        return checked
+                elif keys == {"alarm"} or keys == {"off"}:
+                    if step.get("alarm", step.get("off")) is True:
+                        return step
+            except (TypeError, ValueError, OverflowError):
+                pass
+        raise Exception("Invalid step {}".format(step))
+
+    def running(self):
+        return self.state == RUNNING
+
+    def step(self):
+        """The current step."""
+        return self.steps[self.index]
+
+    def next(self):
+        """Move on to the next step, finishing after the last."""
+        self.index += 1
+        self._origin = self._start = self._deadline = None
+        if self.index >= len(self.steps):
+            self.state = DONE
+
+    def stop(self):
+        if self.running():
+            self.state = STOPPED
+
+    def setpoint(self, now, temp):
+        """
+        Setpoint at ticks_ms now for the current ramp, starting it if new.
+
+        A ramp starts from the bath temperature temp, and moves at its rate
+        from the moment it starts, so setpoints never accumulate rounding.
+        The ramp is over once this returns its target.
+        """
+        step = self.steps[self.index]
+        target = step["ramp"]
+        rate = step["rate"]
+        if self._start is None:
+            self._origin = temp
+            self._start = now
+        if not rate:
+            return target
+        travel = rate * ticks_diff(now, self._start) / 60000
+        if self._origin < target:
+            return min(target, self._origin + travel)
+        return max(target, self._origin - travel)
+
+    def hold_left(self, now):
+        """Seconds of the current hold left, or None until it has started."""
+        if self._deadline is None:
+            return None
+        return max(0, -(ticks_diff(now, self._deadline) // 1000))
+
+    def start_hold(self, now):
+        self._deadline = ticks_add(now, self.steps[self.index]["hold"] * 1000)
+
+    def report(self, now):
+        return {
+            "state": self.state,
+            "step": self.index,
+            "steps": self.steps,
+            "hold_left": self.hold_left(now) if self.running() else None,
+        }
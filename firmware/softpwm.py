@@ -0,0 +1,86 @@
+import uasyncio as asyncio
+from utime import ticks_add, ticks_diff, ticks_ms
+
+import taskprof
+
+
+class softPWM:
+    """
+    Slow software PWM for driving a relay.
+
+    Rather than ticking 1024 times per window the loop sleeps straight to the
+    next on or off edge, so there are at most two wakeups per window.  Changes
+    to duty or frequency wake the loop, which recomputes the edges of the
+    current window: they take effect at once without resetting the phase.
+    """
+
+    def __init__(self, pin, freq=0.005, duty=0):
+        self.pin = pin
+        self.pin.off()
+        self._duty = duty
+        self._period = None
+        self._window = None
+        self._task = None
+        self._sleeping = False
+        self._running = True
+        self.wakeups = 0
+        self.freq(freq)
+        self._task = taskprof.create_task("softpwm", self._loop())
+
+    def freq(self, f=None):
+        if f:
+            self._window = round(1000 / f)
+            # resolution of one duty step, kept for reporting.
+            self._period = round(1000 / (f * 1023))
+            self._wake()
+        return 1000 / self._window
+
+    def duty(self, d=None):
+        if d is not None:
+            if d < 0 or d > 1023:
+                raise Exception("Duty must be between 0 and 1023")
+            old_duty = self._duty
+            self._duty = d
+            if self._duty != old_duty:
+                self._wake()
+        return self._duty
+
+    def deinit(self):
+        """Stop the loop and leave the pin off."""
+        self._running = False
+        self._wake()
+        self.pin.off()
+
+    def _wake(self):
+        """Interrupt the sleep so the current edge is recomputed."""
+        if self._sleeping:
+            self._task.cancel()
+
+    async def _sleep_until(self, deadline):
+        self._sleeping = True
+        try:
+            await asyncio.sleep_ms(max(0, ticks_diff(deadline, ticks_ms())))
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._sleeping = False
+        self.wakeups += 1
+
+    async def _loop(self):
+        start = ticks_ms()
+        while self._running:
+            window = self._window
+            elapsed = ticks_diff(ticks_ms(), start)
+            if elapsed >= window:
+                # drop whole windows so late wakeups do not accumulate drift.
+                start = ticks_add(start, window * (elapsed // window))
+                elapsed = ticks_diff(ticks_ms(), start)
+            on = window * self._duty // 1023
+            if elapsed < on:
+                self.pin.on()
+                edge = on
+            else:
+                self.pin.off()
+                edge = window
+            await self._sleep_until(ticks_add(start, edge))
+        self.pin.off()
@@ -0,0 +1,125 @@
+import uasyncio as asyncio
+from utime import ticks_diff, ticks_ms, ticks_us
+
+enabled = False
+since = None
+# name: [wakeups, total run us, most run us, total lag ms, most lag ms]
+stats = {}
+# the longest step since `take_longest`, as task name and us.
+longest = None
+longest_us = 0
+
+
+class Profiled:
+    """
+    Coroutine wrapper timing each run of the coroutine between awaits.
+
+    Scheduling lag is how long the task sat in the run queue after it was
+    due, which uasyncio v3 keeps as the task's `ph_key`; it is left out
+    where that is not available.  Every step is timed, so that the longest
+    one is known whether or not profiling is enabled: while it is not, a
+    step costs one extra call and a ticks_us pair.
+    """
+
+    def __init__(self, name, coro):
+        self.name = name
+        self.coro = coro
+
+    def send(self, val):
+        return self._step(self.coro.send, val)
+
+    def throw(self, exc, *args):
+        return self._step(self.coro.throw, exc, *args)
+
+    def close(self):
+        return self.coro.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+    def _step(self, fn, *args):
+        global longest
+        global longest_us
+        lag = _lag_ms() if enabled else None
+        start = ticks_us()
+        try:
+            return fn(*args)
+        finally:
+            us = ticks_diff(ticks_us(), start)
+            if us > longest_us:
+                longest = self.name
+                longest_us = us
+            if enabled:
+                self._account(us, lag)
+
+    def _account(self, us, lag):
+        s = stats.get(self.name)
+        if s is None:
+            s = stats[self.name] = [0, 0, 0, 0, 0]
+        s[0] += 1
+        s[1] += us
+        if us > s[2]:
+            s[2] = us
+        if lag is not None:
+            s[3] += lag
+            if lag > s[4]:
+                s[4] = lag
+
+
+def _lag_ms():
+    try:
+        return ticks_diff(ticks_ms(), asyncio.current_task().ph_key)
+    except AttributeError:
+        return None
+
+
+def take_longest():
+    """The longest step since the last call, as (name, us), starting afresh."""
+    global longest
+    global longest_us
+    step = (longest, longest_us)
+    longest = None
+    longest_us = 0
+    return step
+
+
+def create_task(name, coro):
+    """Schedule coro as a task profiled under name."""
+    return asyncio.get_event_loop().create_task(Profiled(name, coro))
+
+
+def enable(val=True):
+    """Start or stop profiling, clearing the stats on start."""
+    global enabled
+    global since
+    if val and not enabled:
+        stats.clear()
+        since = ticks_ms()
+    enabled = val
+
+
+def report():
+    """Stats per task, heaviest first, with the share of time each ran."""
+    elapsed_us = ticks_diff(ticks_ms(), since) * 1000 if since is not None else 0
+    tasks = []
+    for name, s in stats.items():
+        tasks.append(
+            {
+                "name": name,
+                "wakeups": s[0],
+                "run_us": s[1],
+                "run_max_us": s[2],
+                "run_mean_us": s[1] // s[0] if s[0] else 0,
+                "lag_max_ms": s[4],
+                "lag_mean_ms": s[3] / s[0] if s[0] else 0,
+                "share": s[1] / elapsed_us if elapsed_us else 0,
+            }
+        )
+    tasks.sort(key=lambda t: -t["run_us"])
+    return {"enabled": enabled, "elapsed_ms": elapsed_us // 1000, "tasks": tasks}
@@ -0,0 +1,140 @@
+import os
+import socket
+import struct
+
+import machine
+import uasyncio as asyncio
+import ulogging as logging
+from utime import ticks_add, ticks_diff, ticks_ms
+
+import controller
+import hal
+import taskprof
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SV"
+VERSION = 1
+# magic, version, state, device id, boot id, seq, uptime ms, temperature,
+# setpoint, P, I, D, duty, countdown s.  The boot id is random at every boot,
+# and seq counts from 0.  Temperature is NaN before the first reading and
+# countdown -1 without one.  host/telemetry_rx.py decodes this.
+FORMAT = "<2sBB6s2sIIfffffHi"
+SIZE = struct.calcsize(FORMAT)
+STATES = (
+    controller.IDLE,
+    controller.HEATING,
+    controller.HOLDING,
+    controller.AUTOTUNING,
+    controller.MANUAL,
+)
+
+NAN = float("nan")
+
+seq = 0
+sent = 0
+errors = 0
+# pulsed when the telemetry settings change.
+changed = asyncio.Event()
+_frame = bytearray(SIZE)
+_device = machine.unique_id()[:6]
+_boot = os.urandom(2)
+
+
+def pack():
+    """Pack the current state into the frame, reusing its buffer."""
+    countdown = hal.rtc.alarm_left(0) if hal.rtc._alarms else -1
+    p, i, d = hal.pid.components
+    struct.pack_into(
+        FORMAT,
+        _frame,
+        0,
+        MAGIC,
+        VERSION,
+        STATES.index(controller.state),
+        _device,
+        _boot,
+        seq,
+        ticks_ms(),
+        NAN if hal.temp is None else hal.temp,
+        hal.pid.setpoint,
+        p,
+        i,
+        d,
+        hal.relay.duty(),
+        countdown,
+    )
+    return _frame
+
+
+def is_ip(host):
+    """Whether host is a dotted-quad IPv4 address, which needs no DNS lookup."""
+    parts = host.split(".")
+    return len(parts) == 4 and all(
+        p.isdigit() and len(p) <= 3 and int(p) <= 255 for p in parts
+    )
+
+
+def _address():
+    """The configured (host, port), or None if telemetry is off."""
+    host = hal.config["telemetry_host"]
+    if not host:
+        return None
+    if not is_ip(host):
+        # a DNS lookup would block the loop, so hostnames are refused.
+        logger.error("Telemetry host %s is not an IPv4 address", host)
+        return None
+    return (host, hal.config["telemetry_port"])
+
+
+async def sender():
+    """
+    Send a frame every `telemetry_ms` to `telemetry_host`, if one is set.
+
+    The host may be a multicast group.  Frames go out on their schedule
+    whether or not anyone listens, and a failed send is only counted: the
+    sequence number still moves on, so receivers see it as a gap.
+    """
+    global seq
+    global sent
+    global errors
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    while True:
+        addr = _address()
+        if addr is None:
+            await changed.wait()
+            continue
+        due = ticks_ms()
+        while True:
+            try:
+                sock.sendto(pack(), addr)
+                sent += 1
+            except OSError:
+                errors += 1
+            seq += 1
+            due = ticks_add(due, hal.config["telemetry_ms"])
+            try:
+                await asyncio.wait_for_ms(
+                    changed.wait(), max(0, ticks_diff(due, ticks_ms()))
+                )
+                break
+            except asyncio.TimeoutError:
+                # don't try to catch up on frames missed while we were late.
+                if ticks_diff(ticks_ms(), due) > 0:
+                    due = ticks_ms()
+
+
+def report():
+    return {
+        "host": hal.config["telemetry_host"],
+        "port": hal.config["telemetry_port"],
+        "interval_ms": hal.config["telemetry_ms"],
+        "seq": seq,
+        "sent": sent,
+        "errors": errors,
+    }
+
+
+def init(loop):
+    taskprof.create_task("telemetry", sender())
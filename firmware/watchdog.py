@@ -0,0 +1,87 @@
+import time
+
+import machine
+import uasyncio as asyncio
+import ulogging as logging
+from utime import ticks_add, ticks_diff, ticks_ms
+
+import controller
+import hal
+import taskprof
+
+logger = logging.getLogger(__name__)
+
+TICK_MS = 100
+# the heat loop passes at least every STALE_MS, so this long without one
+# means it is stuck or dead.
+PROGRESS_MS = 2 * controller.STALE_MS
+
+wdt = None
+feeding = True
+stalls = 0
+stall_max_ms = 0
+# (time, ms late, longest step's task, its ms) for the latest stall.
+last_stall = None
+
+
+async def monitor():
+    """
+    Wake every TICK_MS, noting how late each wakeup is.
+
+    A wakeup more than `stall_ms` late is logged as a stall, along with the
+    longest task step taskprof timed since the last wakeup, which is the
+    culprit unless that step was much shorter: then the time went in a task
+    taskprof does not wrap, or in many short steps.  The hardware watchdog
+    is fed only while the heat loop keeps passing, so a wedged loop or a
+    dead heat loop task resets the board rather than leaving the relay as
+    it was.
+    """
+    global feeding
+    global stalls
+    global stall_max_ms
+    global last_stall
+    due = ticks_add(ticks_ms(), TICK_MS)
+    while True:
+        await asyncio.sleep_ms(max(0, ticks_diff(due, ticks_ms())))
+        now = ticks_ms()
+        late = ticks_diff(now, due)
+        name, us = taskprof.take_longest()
+        if late > hal.config["stall_ms"]:
+            stalls += 1
+            stall_max_ms = max(stall_max_ms, late)
+            last_stall = (time.time(), late, name, us // 1000)
+            logger.warning(
+                "Loop stalled %d ms, longest step %d ms in %s", late, us // 1000, name
+            )
+        if ticks_diff(now, controller.heartbeat) < PROGRESS_MS:
+            if wdt is not None:
+                wdt.feed()
+            feeding = True
+        elif feeding:
+            logger.error("Heat loop stuck, no longer feeding the watchdog")
+            feeding = False
+        due = ticks_add(now, TICK_MS)
+
+
+def report():
+    return {
+        "watchdog_ms": hal.config["watchdog_ms"] if wdt is not None else 0,
+        "feeding": feeding,
+        "stall_ms": hal.config["stall_ms"],
+        "stalls": stalls,
+        "stall_max_ms": stall_max_ms,
+        "last_stall": last_stall,
+    }
+
+
+def init(loop):
+    """
+    Start the monitor, arming the hardware watchdog unless `watchdog_ms` is 0.
+
+    Once armed the watchdog cannot be stopped, even by leaving the event loop
+    for the failsafe REPL.
+    """
+    global wdt
+    if hal.config["watchdog_ms"]:
+        wdt = machine.WDT(timeout=hal.config["watchdog_ms"])
+    taskprof.create_task("watchdog", monitor())
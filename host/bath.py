@@ -0,0 +1,72 @@
+"""Thermal model of a heated water bath and the probes in it."""
+import math
+
+
+class Bath:
+    """
+    Well-mixed water bath with a switched heater and Newtonian heat loss.
+
+    The heater is either on or off, so between switchings the temperature
+    follows an exact exponential; the model is advanced lazily whenever it is
+    read or the heater is switched.
+    """
+
+    def __init__(
+        self, clock, volume=8.0, power=1000.0, loss=4.0, ambient=20.0, temp=20.0
+    ):
+        self.clock = clock
+        self.capacity = volume * 4186.0  # J/K for water
+        self.power = power  # W
+        self.loss = loss  # W/K
+        self.ambient = ambient
+        self.temp = temp
+        self.heater = 0
+        self.energy = 0.0  # J delivered by the heater
+        self._t = clock()
+
+    def advance(self):
+        now = self.clock()
+        dt = now - self._t
+        if dt > 0:
+            steady = self.ambient + self.power * self.heater / self.loss
+            decay = math.exp(-dt * self.loss / self.capacity)
+            self.temp = steady + (self.temp - steady) * decay
+            self.energy += self.power * self.heater * dt
+            self._t = now
+        return self.temp
+
+    def set_heater(self, on):
+        self.advance()
+        self.heater = 1 if on else 0
+
+    def duty_to_hold(self, temp):
+        """Fraction of full power needed to hold temp."""
+        return (temp - self.ambient) * self.loss / self.power
+
+
+class LaggedSensor:
+    """
+    What a probe in the bath reads: the bath temperature through a first
+    order lag (the probe sheath and imperfect mixing), plus an offset and
+    gaussian noise from a seeded generator.
+    """
+
+    def __init__(self, bath, rng, lag=15.0, noise=0.02, offset=0.0):
+        self.bath = bath
+        self.rng = rng
+        self.lag = lag
+        self.noise = noise
+        self.offset = offset
+        self.value = bath.advance()
+        self._t = bath.clock()
+
+    def __call__(self):
+        temp = self.bath.advance()
+        now = self.bath.clock()
+        dt = now - self._t
+        self._t = now
+        if self.lag:
+            self.value = temp + (self.value - temp) * math.exp(-dt / self.lag)
+        else:
+            self.value = temp
+        return self.value + self.offset + self.rng.gauss(0, self.noise)
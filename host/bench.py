@@ -0,0 +1,260 @@
+"""
+Benchmark the firmware's hot paths against the host stand-ins.
+
+- control: how many samples the PID misses or reuses, and CPU time and heap
+  per control update.  Runs on the virtual clock, so the scheduling figures
+  are exact and repeatable.
+- reaction: wall time from a fresh sample being announced to the relay duty
+  being set from it, while the HTTP handlers are kept busy, in real time.
+- pwm: relay edge jitter while the HTTP handlers are kept busy, in real time.
+- api: /api/status requests per second and heap per request.
+
+Each benchmark runs in its own process, since the firmware keeps module
+level state.  Results are written as JSON; given a baseline from an earlier
+run, any metric more than --tolerance worse is reported and the exit status
+is 1.  Heap figures are CPython's tracemalloc peaks: useful for comparing
+runs, not a prediction of MicroPython's heap.
+
+Usage: python host/bench.py [--out results.json] [--baseline old.json]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+here = Path(__file__).resolve().parent
+
+# metric: True if larger is better.
+HIGHER_IS_BETTER = {
+    "control.missed_samples": False,
+    "control.stale_updates": False,
+    "control.update_us": False,
+    "control.update_heap_bytes": False,
+    "reaction.mean_ms": False,
+    "reaction.max_ms": False,
+    "pwm.jitter_mean_ms": False,
+    "pwm.jitter_max_ms": False,
+    "api.status_per_s": True,
+    "api.status_heap_bytes": False,
+}
+
+
+def heap_peak(fn, *args):
+    """Peak bytes allocated by tracemalloc while running fn."""
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    res = fn(*args)
+    return res, tracemalloc.get_traced_memory()[1] - base
+
+
+def instrument_pid(hal, record):
+    """Have every PID update call record(seq, us, heap)."""
+    cls = type(hal.pid)
+
+    class Instrumented(cls):
+        def __call__(self, *args, **kwargs):
+            start = time.perf_counter()
+            res, heap = heap_peak(super().__call__, *args, **kwargs)
+            us = (time.perf_counter() - start) * 1e6
+            record(hal.temp_seq, us, heap)
+            return res
+
+    hal.pid.__class__ = Instrumented
+
+
+def bench_control(hours=1.0):
+    import sim
+
+    s = sim.Simulation()
+    updates = []
+    instrument_pid(s.hal, lambda *update: updates.append(update))
+    tracemalloc.start()
+    s.cook(60, hours * 3600)
+    tracemalloc.stop()
+    first = updates[0][0]
+    samples = s.hal.temp_seq - first + 1
+    # the PID is meant to act on every decimation-th sample.
+    decimation = s.hal.config.get("pid_decimation", 1)
+    used = len({u[0] for u in updates})
+    return {
+        "updates": len(updates),
+        "samples": samples,
+        "missed_samples": samples // decimation - used,
+        "stale_updates": len(updates) - used,
+        "update_us": sum(u[1] for u in updates) / len(updates),
+        "update_heap_bytes": max(u[2] for u in updates),
+    }
+
+
+def bench_reaction(seconds=20.0):
+    """
+    Wall time from temp_event being pulsed to the duty the update yields.
+
+    The virtual clock stands still while code runs, so this needs real time.
+    The fastest resolution gives enough samples in a short run.
+    """
+    import sim
+
+    s = sim.Simulation(realtime=True)
+    hal = s.hal
+    hal.set_resolution(9)
+    pulsed = []
+    reactions = []
+    pulse = hal.pulse
+
+    def timed_pulse(event):
+        if event is hal.temp_event:
+            pulsed.append(time.perf_counter())
+        pulse(event)
+
+    hal.pulse = timed_pulse
+    relay_duty = hal.relay.duty
+    pending = []
+
+    def timed_duty(d=None):
+        if d is not None and pending:
+            reactions.append((time.perf_counter() - pending.pop()) * 1000)
+        return relay_duty(d)
+
+    def updated(*_):
+        # the update acts on the latest sample.
+        pending[:] = pulsed[-1:]
+
+    hal.relay.duty = timed_duty
+    instrument_pid(hal, updated)
+    stop = []
+    hammer = s.loop.create_task(_hammer(s.api.app, stop))
+    s.cook(60, seconds)
+    stop.append(True)
+    requests = s.loop.run_until_complete(hammer)
+    return {
+        "updates": len(reactions),
+        "requests": requests,
+        "mean_ms": sum(reactions) / len(reactions),
+        "max_ms": max(reactions),
+    }
+
+
+async def _hammer(app, stop):
+    import uasyncio as asyncio
+
+    n = 0
+    while not stop:
+        await app.request("GET", "/api/status")
+        n += 1
+        # as the next request would arrive on the socket
+        await asyncio.sleep(0)
+    return n
+
+
+def bench_pwm(seconds=6.0, freq=1.0, duty=300):
+    import bench_pwm
+    import machine
+    import sim
+    import uasyncio as asyncio
+    from utime import ticks_us
+
+    s = sim.Simulation(realtime=True)
+    edges = []
+    machine.watch(sim.RELAY_PIN, lambda v: edges.append((ticks_us(), v)))
+    s.hal.relay.freq(freq)
+    s.hal.relay.duty(duty)
+    stop = []
+    hammer = s.loop.create_task(_hammer(s.api.app, stop))
+    s.loop.run_until_complete(asyncio.sleep(seconds))
+    stop.append(True)
+    requests = s.loop.run_until_complete(hammer)
+    window = s.hal.relay._window
+    # an edge is only recorded when the pin changes.
+    changes = [e for i, e in enumerate(edges) if not i or e[1] != edges[i - 1][1]]
+    dev = bench_pwm.jitter(changes, window * 1000, window * 1000 * duty // 1023)
+    return {
+        "edges": len(dev),
+        "requests": requests,
+        "jitter_mean_ms": sum(dev) / len(dev) / 1000,
+        "jitter_max_ms": max(dev) / 1000,
+    }
+
+
+def bench_api(requests=2000):
+    import sim
+
+    s = sim.Simulation(realtime=True)
+    s.run(2)
+    app = s.api.app
+    start = time.perf_counter()
+    for _ in range(requests):
+        s.loop.run_until_complete(app.request("GET", "/api/status"))
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    _, heap = heap_peak(s.loop.run_until_complete, app.request("GET", "/api/status"))
+    tracemalloc.stop()
+    return {"status_per_s": requests / elapsed, "status_heap_bytes": heap}
+
+
+BENCHMARKS = {
+    "control": bench_control,
+    "reaction": bench_reaction,
+    "pwm": bench_pwm,
+    "api": bench_api,
+}
+
+
+def run_child(name):
+    sys.path.insert(0, str(here))
+    import sim  # noqa: F401 - sets up the import path
+
+    print(json.dumps(BENCHMARKS[name]()))
+
+
+def compare(results, baseline, tolerance):
+    """Yield a message for each metric which is worse than baseline."""
+    for key, higher in HIGHER_IS_BETTER.items():
+        group, metric = key.split(".")
+        old = baseline.get(group, {}).get(metric)
+        new = results.get(group, {}).get(metric)
+        if old is None or new is None:
+            continue
+        worse = new < old * (1 - tolerance) if higher else new > old * (1 + tolerance)
+        # ignore noise around zero
+        if worse and abs(new - old) > 1e-3:
+            yield "{}: {:.4g} -> {:.4g}".format(key, old, new)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--run", choices=BENCHMARKS, help=argparse.SUPPRESS)
+    parser.add_argument("--only", action="append", choices=BENCHMARKS)
+    parser.add_argument("--out", help="write JSON results here")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    if args.run:
+        return run_child(args.run)
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        out = subprocess.run(
+            [sys.executable, __file__, "--run", name],
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout
+        results[name] = json.loads(out.strip().splitlines()[-1])
+        print(name, json.dumps(results[name], indent=1))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = list(compare(results, json.load(f), args.tolerance))
+        for msg in regressions:
+            print("REGRESSION", msg)
+        return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+Micro-benchmark libs/logging: calls per second for suppressed and emitted records.
+
+Usage: python host/bench_logging.py [--calls 200000]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+here = Path(__file__).resolve().parent
+sys.path[:0] = [str(here / "lib")]
+
+import ulogging as logging  # noqa: E402
+
+
+class NullStream:
+    def write(self, s):
+        pass
+
+
+def rate(fn, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        stream=NullStream(),
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    logger = logging.getLogger("bench")
+    cases = (
+        ("suppressed, preformatted", lambda i: logger.debug("Got {}".format(i))),
+        ("suppressed, lazy args", lambda i: logger.debug("Got %s", i)),
+        ("emitted, lazy args", lambda i: logger.info("Got %s", i)),
+    )
+    for name, fn in cases:
+        print("{:<26} {:>12.0f} calls/s".format(name, rate(fn, args.calls)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Measure wakeups per cycle and edge jitter of the relay PWM engines on a host.
+
+Runs the tick-based engine which used to live in `hal` and the edge-scheduled
+`softpwm.softPWM` against a recording pin, with a competing task occasionally
+blocking the loop as the sensor and HTTP tasks do on the board.
+
+Usage: python host/bench_pwm.py [--freq 1] [--cycles 4] [--duty 300]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+here = Path(__file__).resolve().parent
+sys.path[:0] = [str(here / "lib"), str(here.parent / "firmware")]
+
+import uasyncio as asyncio  # noqa: E402
+from utime import ticks_us  # noqa: E402
+
+from softpwm import softPWM  # noqa: E402
+
+
+class RecordingPin:
+    def __init__(self):
+        self.state = 0
+        self.edges = []
+
+    def on(self):
+        if not self.state:
+            self.edges.append((ticks_us(), 1))
+        self.state = 1
+
+    def off(self):
+        if self.state:
+            self.edges.append((ticks_us(), 0))
+        self.state = 0
+
+
+class LegacyPWM(softPWM):
+    """The 1024-step tick loop previously in `hal.softPWM`."""
+
+    def freq(self, f=None):
+        if f:
+            self._period = round(1000 / (f * 1023))
+            self._window = self._period * 1024
+            self._reset = True
+        return 1023000 / self._period
+
+    def duty(self, d=None):
+        if d is not None:
+            old_duty = self._duty
+            self._duty = d
+            if self._duty != old_duty:
+                self._reset = True
+        return self._duty
+
+    async def _loop(self):
+        count = 0
+        while self._running:
+            if count == self._duty:
+                self.pin.off()
+            count += 1
+            if count > 1023 or self._reset:
+                self._reset = False
+                count = 0
+                if self._duty:
+                    self.pin.on()
+            await asyncio.sleep_ms(self._period)
+            self.wakeups += 1
+
+
+async def load(block_ms, every_ms):
+    while True:
+        await asyncio.sleep_ms(every_ms)
+        time.sleep(block_ms / 1000)
+
+
+def jitter(edges, window_us, on_us):
+    """Deviation in us of each edge from its ideal time, phase-locked to the first."""
+    rising = [t for t, v in edges if v]
+    if not rising:
+        return []
+    t0 = rising[0]
+    out = []
+    for t, v in edges:
+        offset = 0 if v else on_us
+        k = round((t - t0 - offset) / window_us)
+        out.append(abs(t - (t0 + k * window_us + offset)))
+    return out
+
+
+def run(cls, freq, duty, cycles, block_ms, every_ms):
+    loop = asyncio.new_event_loop()
+    pin = RecordingPin()
+    pwm = cls(pin, freq=freq, duty=duty)
+    background = loop.create_task(load(block_ms, every_ms))
+    window_ms = pwm._window
+    loop.run_until_complete(asyncio.sleep_ms(window_ms * cycles))
+    edges = list(pin.edges)
+    pwm.deinit()
+    background.cancel()
+    loop.run_until_complete(asyncio.sleep_ms(pwm._period + 1))
+    loop.close()
+    dev = jitter(edges, window_ms * 1000, window_ms * 1000 * duty // 1023)
+    return {
+        "wakeups_per_cycle": pwm.wakeups / cycles,
+        "edges": len(edges),
+        "jitter_mean_ms": sum(dev) / len(dev) / 1000 if dev else None,
+        "jitter_max_ms": max(dev) / 1000 if dev else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--freq", type=float, default=1)
+    parser.add_argument("--duty", type=int, default=300)
+    parser.add_argument("--cycles", type=int, default=4)
+    parser.add_argument("--block-ms", type=float, default=3)
+    parser.add_argument("--every-ms", type=float, default=40)
+    args = parser.parse_args()
+    for name, cls in (("tick", LegacyPWM), ("edge", softPWM)):
+        res = run(cls, args.freq, args.duty, args.cycles, args.block_ms, args.every_ms)
+        print(
+            "{:<5} wakeups/cycle {:>7.1f}  edges {:>3}  "
+            "jitter mean {:>7.2f} ms  max {:>7.2f} ms".format(
+                name,
+                res["wakeups_per_cycle"],
+                res["edges"],
+                res["jitter_mean_ms"] or 0,
+                res["jitter_max_ms"] or 0,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Precompile the firmware and libs/logging to .mpy for deploying to the board.
+
+Every firmware module except main.py (which MicroPython only runs from source)
+and secret.py (kept editable on the board) is compiled with mpy-cross into the
+output tree, following the links into the library submodules.  libs/logging
+is compiled as the ulogging package the firmware imports.  Links whose
+submodule is not checked out are reported and skipped.
+
+Importing a .mpy skips parsing and compiling on the board, which is most of
+the import time of a module and a lot of transient heap.
+
+Usage: python host/build.py [--out build] [--arch xtensawin] [--mpy-cross PATH]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+here = Path(__file__).resolve().parent
+root = here.parent
+
+# run from source on the board.
+SOURCE_ONLY = {"main.py", "secret.py"}
+
+
+def sources():
+    """Yield (source, destination relative to the output) pairs."""
+    firmware = root / "firmware"
+    for path in sorted(firmware.iterdir()):
+        if path.suffix == ".py":
+            yield path, path.relative_to(firmware)
+        elif path.is_symlink() and not path.exists():
+            yield path, path.relative_to(firmware)
+        elif path.is_dir() and path.name != "__pycache__":
+            # linked package directories, such as primitives.
+            for dirpath, dirnames, filenames in os.walk(path, followlinks=True):
+                dirnames[:] = [d for d in dirnames if d != "__pycache__"]
+                for fn in sorted(filenames):
+                    if fn.endswith(".py"):
+                        src = Path(dirpath) / fn
+                        yield src, src.relative_to(firmware)
+    for path in sorted((root / "libs" / "logging").glob("*.py")):
+        yield path, Path("ulogging") / path.name
+
+
+def build(out, arch, mpy_cross):
+    compiled = copied = 0
+    for src, rel in sources():
+        if not src.exists():
+            print("skipping {}: submodule not checked out".format(rel))
+            continue
+        dest = out / rel
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if rel.name in SOURCE_ONLY and len(rel.parts) == 1:
+            shutil.copyfile(src, dest)
+            copied += 1
+            continue
+        dest = dest.with_suffix(".mpy")
+        subprocess.run(
+            [mpy_cross, "-march=" + arch, "-o", str(dest), str(src)], check=True
+        )
+        compiled += 1
+    print("compiled {} modules and copied {} to {}".format(compiled, copied, out))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--out", default=str(root / "build"))
+    # ESP32; needed for @micropython.native.
+    parser.add_argument("--arch", default="xtensawin")
+    parser.add_argument("--mpy-cross", default="mpy-cross")
+    args = parser.parse_args()
+    if not shutil.which(args.mpy_cross):
+        sys.exit("{} not found: pip install mpy-cross".format(args.mpy_cross))
+    out = Path(args.out)
+    if out.exists():
+        shutil.rmtree(out)
+    build(out, args.arch, args.mpy_cross)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Host stand-in for the ds18x20 driver, and a simulated DS18B20 probe.
+
+A Probe reads the temperature from a callable, honouring the conversion
+time and quantisation of its configured resolution: reading before the
+conversion has finished returns the previous result, as the real part does.
+"""
+from utime import ticks_diff, ticks_ms
+
+# conversion time in ms for 9, 10, 11 and 12 bit resolution.
+CONVERSION_MS = (94, 188, 375, 750)
+
+
+class Probe:
+    def __init__(self, rom, source):
+        self.rom = bytes(rom)
+        self.source = source
+        self.th = 0x4B
+        self.tl = 0x46
+        self.config = 0x7F
+        self.result = 85.0
+        self._started = None
+        self.conversions = 0
+
+    @property
+    def bits(self):
+        return ((self.config >> 5) & 3) + 9
+
+    def convert(self):
+        self._started = ticks_ms()
+        self.conversions += 1
+
+    def latch(self):
+        """Finish any conversion which has had time to complete."""
+        if self._started is None:
+            return
+        if ticks_diff(ticks_ms(), self._started) >= CONVERSION_MS[self.bits - 9]:
+            step = 0.5 / (1 << (self.bits - 9))
+            self.result = round(self.source() / step) * step
+            self._started = None
+
+
+class DS18X20:
+    def __init__(self, onewire):
+        self.ow = onewire
+
+    def scan(self):
+        return [rom for rom in self.ow.scan() if rom[0] in (0x10, 0x22, 0x28)]
+
+    def convert_temp(self):
+        for dev in self.ow.devices():
+            dev.convert()
+
+    def read_scratch(self, rom):
+        dev = self.ow.device(rom)
+        dev.latch()
+        raw = int(dev.result * 16) & 0xFFFF
+        return bytearray(
+            (raw & 0xFF, raw >> 8, dev.th, dev.tl, dev.config, 0xFF, 0, 0x10, 0)
+        )
+
+    def write_scratch(self, rom, buf):
+        dev = self.ow.device(rom)
+        dev.th, dev.tl, dev.config = buf[0], buf[1], buf[2]
+
+    def read_temp(self, rom):
+        dev = self.ow.device(rom)
+        dev.latch()
+        return dev.result
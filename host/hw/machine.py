@@ -0,0 +1,101 @@
+"""
+Host stand-in for the machine module.
+
+Pins keep their value in memory; `watch` lets a simulation react to a pin
+being driven, e.g. the relay switching the heater.
+"""
+
+_watchers = {}
+
+
+def watch(pin_id, fn):
+    """Call fn(value) whenever pin pin_id is written."""
+    _watchers.setdefault(pin_id, []).append(fn)
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 2
+    PULL_DOWN = 1
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode=-1, pull=-1, *, value=None):
+        self.id = id
+        self._value = 0 if value is None else value
+        self._handler = None
+
+    def value(self, x=None):
+        if x is None:
+            return self._value
+        self._value = 1 if x else 0
+        for fn in _watchers.get(self.id, ()):
+            fn(self._value)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_RISING | IRQ_FALLING):
+        self._handler = handler
+        return self
+
+    def trigger(self, value):
+        """Drive an input from outside, firing its irq handler."""
+        self._value = value
+        if self._handler:
+            self._handler(self)
+
+
+class PWM:
+    def __init__(self, pin, freq=1000, duty=0):
+        self.pin = pin
+        self._freq = freq
+        self._duty = duty
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def duty(self, d=None):
+        if d is None:
+            return self._duty
+        self._duty = d
+
+    def deinit(self):
+        self._duty = 0
+
+
+class RTC:
+    def datetime(self, dt=None):
+        import utime
+
+        if dt is None:
+            t = utime.localtime()
+            return (t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0)
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        self.timeout = timeout
+        self.fed = 0
+
+    def feed(self):
+        self.fed += 1
+
+
+class Reset(Exception):
+    """Raised where the board would reset."""
+
+
+def reset():
+    raise Reset()
+
+
+def unique_id():
+    return b"\x00\x00sim\x00"
@@ -0,0 +1,24 @@
+"""Host stand-in for the network module; always connects at once."""
+
+STA_IF = 0
+AP_IF = 1
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self._active = False
+        self._connected = False
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return self._active
+        self._active = is_active
+
+    def connect(self, ssid=None, password=None):
+        self._connected = True
+
+    def isconnected(self):
+        return self._connected
+
+    def ifconfig(self):
+        return ("127.0.0.1", "255.0.0.0", "127.0.0.1", "127.0.0.1")
@@ -0,0 +1,37 @@
+"""Host stand-in for the onewire module: a bus of simulated devices."""
+
+_buses = {}
+
+
+class OneWireError(Exception):
+    pass
+
+
+def attach(pin_id, device):
+    """Put device (anything with a `rom`) on the bus on pin pin_id."""
+    _buses.setdefault(pin_id, []).append(device)
+
+
+def detach(pin_id, device):
+    _buses.get(pin_id, []).remove(device)
+
+
+class OneWire:
+    SEARCH_ROM = 0xF0
+    MATCH_ROM = 0x55
+    SKIP_ROM = 0xCC
+
+    def __init__(self, pin):
+        self.pin = pin
+
+    def devices(self):
+        return _buses.get(self.pin.id, [])
+
+    def device(self, rom):
+        for dev in self.devices():
+            if dev.rom == rom:
+                return dev
+        raise OneWireError("no device {}".format(bytes(rom).hex()))
+
+    def scan(self):
+        return [bytearray(dev.rom) for dev in self.devices()]
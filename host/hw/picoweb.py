@@ -0,0 +1,94 @@
+"""
+Host stand-in for picoweb.
+
+Routes are registered as usual, but rather than serving HTTP, `request`
+runs a handler in-process against a response object which collects what
+it writes.  Handlers are generators, as on the board; they are marked as
+coroutines so that they can `yield from` asyncio coroutines on CPython.
+"""
+import types
+
+
+class Response:
+    def __init__(self):
+        self.status = None
+        self.headers = {}
+        self.chunks = []
+
+    async def awrite(self, s):
+        self.chunks.append(s)
+
+    @property
+    def body(self):
+        return "".join(self.chunks)
+
+
+class Reader:
+    def __init__(self, body):
+        self.body = body
+
+    # a plain generator, so that helpers which are not routes can yield from it.
+    @types.coroutine
+    def readexactly(self, n):
+        data, self.body = self.body[:n], self.body[n:]
+        return data
+        yield
+
+
+class Request:
+    def __init__(self, method, path, body=b""):
+        self.method = method
+        self.path, _, self.qs = path.partition("?")
+        self.url_match = None
+        self.form = {}
+        self.headers = {b"Content-Length": str(len(body)).encode()}
+        self.reader = Reader(body)
+
+    def parse_qs(self):
+        self.form = dict(
+            pair.split("=", 1) for pair in self.qs.split("&") if "=" in pair
+        )
+
+
+async def start_response(
+    writer, content_type="text/html; charset=utf-8", status="200", headers=None
+):
+    writer.status = status
+    writer.headers = dict(headers or {}, content_type=content_type)
+
+
+class WebApp:
+    def __init__(self, pkg, routes=None):
+        self.routes = []
+
+    def route(self, url, **kwargs):
+        def _route(f):
+            f = types.coroutine(f)
+            self.routes.append((url, kwargs.get("methods", ["GET"]), f))
+            return f
+
+        return _route
+
+    def run(self, host="127.0.0.1", port=8081, debug=False, lazy_init=False):
+        pass
+
+    def find(self, method, path, body=b""):
+        req = Request(method, path, body)
+        for url, methods, f in self.routes:
+            if method not in methods:
+                continue
+            if isinstance(url, str):
+                if url == req.path:
+                    return f, req
+            else:
+                req.url_match = url.match(req.path)
+                if req.url_match:
+                    return f, req
+        raise KeyError("no route for {} {}".format(method, path))
+
+    async def request(self, method, path, body=b""):
+        """Run the handler for path with a request body, returning the Response."""
+        f, req = self.find(method, path, body)
+        resp = Response()
+        await f(req, resp)
+        return resp
@@ -0,0 +1,43 @@
+"""Host stand-in for the TM1637 display driver, remembering what is shown."""
+
+
+class TM1637:
+    def __init__(self, clk, dio, brightness=7):
+        self._brightness = brightness
+        self.text = ""
+        self.segments = bytes(4)
+        self.writes = 0
+
+    def brightness(self, val=None):
+        if val is None:
+            return self._brightness
+        if not 0 <= val <= 7:
+            raise ValueError("Brightness out of range")
+        self._brightness = val
+
+    @staticmethod
+    def encode_char(char):
+        # not the real segments, but distinct for each character shown.
+        return ord(char) & 0x7F
+
+    def encode_string(self, string):
+        return bytearray(self.encode_char(c) for c in string)
+
+    def write(self, segments, pos=0):
+        self.segments = bytes(segments)
+        self.writes += 1
+
+    def show(self, string, colon=False):
+        self.text = string
+        self.write(self.encode_string(string)[:4])
+
+
+class TM1637Decimal(TM1637):
+    def encode_string(self, string):
+        segments = bytearray()
+        for c in string:
+            if c == "." and segments:
+                segments[-1] |= 0x80
+            else:
+                segments.append(self.encode_char(c))
+        return segments
@@ -0,0 +1,20 @@
+"""CPython stand-in for the micropython module."""
+
+
+def native(f):
+    return f
+
+
+viper = native
+
+
+def const(x):
+    return x
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def schedule(fn, arg):
+    fn(arg)
@@ -0,0 +1,56 @@
+"""CPython stand-in for uasyncio, enough to run firmware modules on a host."""
+import asyncio as _asyncio
+from asyncio import *  # noqa
+
+_loop = None
+
+
+def get_event_loop(runq_len=None, waitq_len=None):
+    global _loop
+    try:
+        return _asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    if _loop is None or _loop.is_closed():
+        _loop = _asyncio.new_event_loop()
+        _asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def new_event_loop():
+    global _loop
+    _loop = None
+    return get_event_loop()
+
+
+def set_event_loop(loop):
+    global _loop
+    _loop = loop
+    _asyncio.set_event_loop(loop)
+
+
+class ThreadSafeFlag:
+    """An event which is cleared by the wait it ends, as in uasyncio."""
+
+    def __init__(self):
+        self._event = _asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
+
+
+def create_task(coro):
+    # uasyncio allows this before the loop is running.
+    return get_event_loop().create_task(coro)
+
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
+
+
+def wait_for_ms(aw, timeout):
+    return _asyncio.wait_for(aw, timeout / 1000)
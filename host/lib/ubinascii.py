@@ -0,0 +1,2 @@
+"""CPython stand-in for ubinascii."""
+from binascii import *  # noqa
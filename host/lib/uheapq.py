@@ -0,0 +1,2 @@
+"""CPython stand-in for uheapq."""
+from heapq import heappop, heappush, heapify  # noqa
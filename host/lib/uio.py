@@ -0,0 +1,2 @@
+"""CPython stand-in for uio."""
+from io import *  # noqa
@@ -0,0 +1,2 @@
+"""CPython stand-in for ujson."""
+from json import *  # noqa
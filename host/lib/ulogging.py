@@ -0,0 +1,12 @@
+"""Load the firmware's logging package, libs/logging, as ulogging."""
+import importlib.util
+import sys
+from pathlib import Path
+
+_path = Path(__file__).resolve().parents[2] / "libs" / "logging" / "__init__.py"
+_spec = importlib.util.spec_from_file_location(
+    __name__, _path, submodule_search_locations=[str(_path.parent)]
+)
+_module = importlib.util.module_from_spec(_spec)
+sys.modules[__name__] = _module
+_spec.loader.exec_module(_module)
@@ -0,0 +1,2 @@
+"""CPython stand-in for ure."""
+from re import *  # noqa
@@ -0,0 +1,52 @@
+"""CPython stand-in for utime.
+
+The clock can be replaced with `set_clock` so that firmware code sees the
+same time base as the event loop driving it.
+"""
+import time as _time
+
+_clock = _time.monotonic
+_epoch = _time.time() - _time.monotonic()
+
+
+def set_clock(fn, epoch=None):
+    """Use fn() (seconds, monotonic) as the time base."""
+    global _clock, _epoch
+    _clock = fn
+    _epoch = _time.time() - fn() if epoch is None else epoch
+
+
+def ticks_ms():
+    return int(_clock() * 1000)
+
+
+def ticks_us():
+    return int(_clock() * 1000000)
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+
+def ticks_diff(a, b):
+    return a - b
+
+
+def time():
+    return int(_epoch + _clock())
+
+
+def localtime(secs=None):
+    return _time.localtime(time() if secs is None else secs)
+
+
+def mktime(t):
+    return int(_time.mktime(tuple(t)))
+
+
+def sleep(s):
+    _time.sleep(s)
+
+
+def sleep_ms(ms):
+    _time.sleep(ms / 1000)
@@ -0,0 +1,244 @@
+"""
+Run the firmware on a host against a simulated water bath, faster than real time.
+
+The firmware modules are imported unchanged.  MicroPython runtime modules come
+from host/lib and the board's peripherals from host/hw: the relay pin drives a
+thermal model of the bath, and simulated DS18B20 probes on the 1-Wire pin read
+it.  Everything runs under an asyncio loop with a virtual clock, so a cook of
+several hours takes seconds and, for a given seed, always comes out the same.
+
+Library dependencies (simple-pid's PID and micropython-async's primitives) are
+not simulated: check out the submodules or put them on PYTHONPATH.  The firmware
+keeps module-level state, so there can only be one Simulation per process.
+With realtime=True an ordinary event loop is used instead, for measuring how the
+firmware behaves under CPU load.
+
+Usage: python host/sim.py [--setpoint 60] [--hours 3] [--volume 8] [--seed 0]
+       python host/sim.py --program '[{"ramp": 55, "rate": 1}, {"hold": 3600}]'
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+here = Path(__file__).resolve().parent
+sys.path[:0] = [str(here / "hw"), str(here / "lib"), str(here)]
+# last, so library dependencies on PYTHONPATH win over dangling submodule links.
+sys.path.append(str(here.parent / "firmware"))
+
+import ds18x20  # noqa: E402
+import machine  # noqa: E402
+import onewire  # noqa: E402
+import uasyncio as asyncio  # noqa: E402
+import utime  # noqa: E402
+from bath import Bath, LaggedSensor  # noqa: E402
+from vclock import VirtualLoop  # noqa: E402
+
+RELAY_PIN = 13
+SENSOR_PIN = 15
+# 2000-01-01, the MicroPython epoch, so timestamps are repeatable.
+EPOCH = 946684800
+
+
+def load_firmware():
+    """Import hal, controller and api, with `time` meaning utime as on the board."""
+    import json  # noqa: F401 - make sure stdlib users of time are loaded first
+
+    saved = sys.modules["time"]
+    sys.modules["time"] = utime
+    try:
+        import api
+        import controller
+        import hal
+    finally:
+        sys.modules["time"] = saved
+    return hal, controller, api
+
+
+class Simulation:
+    def __init__(
+        self,
+        volume=8.0,
+        power=1000.0,
+        loss=4.0,
+        ambient=20.0,
+        start=20.0,
+        probes=1,
+        lag=15.0,
+        noise=0.02,
+        seed=0,
+        realtime=False,
+    ):
+        self.loop = asyncio.new_event_loop() if realtime else VirtualLoop()
+        asyncio.set_event_loop(self.loop)
+        if not realtime:
+            utime.set_clock(self.loop.time, epoch=EPOCH)
+        self.workdir = tempfile.mkdtemp(prefix="sous-vide-sim-")
+        os.chdir(self.workdir)
+
+        self.bath = Bath(self.loop.time, volume, power, loss, ambient, start)
+        machine.watch(RELAY_PIN, self.bath.set_heater)
+        rng = random.Random(seed)
+        self.probes = []
+        for i in range(probes):
+            rom = bytes((0x28, i + 1, 0, 0, 0, 0, 0, 0))
+            probe = ds18x20.Probe(rom, LaggedSensor(self.bath, rng, lag, noise))
+            onewire.attach(SENSOR_PIN, probe)
+            self.probes.append(probe)
+
+        self.hal, self.controller, self.api = load_firmware()
+        self.hal.init(self.loop)
+        self.controller.init(self.loop)
+        self.trace = []
+        self.loop.create_task(self._recorder())
+
+    @property
+    def now(self):
+        return self.loop.time()
+
+    async def _recorder(self, interval=5):
+        while True:
+            self.trace.append(
+                (
+                    self.now,
+                    self.bath.advance(),
+                    self.hal.temp,
+                    self.hal.relay.duty(),
+                    self.hal.pid.setpoint,
+                    self.controller.state,
+                )
+            )
+            await asyncio.sleep(interval)
+
+    def run(self, seconds):
+        """Advance the simulation by seconds of virtual time."""
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+    def request(self, path, method="GET", body=b""):
+        """Call an API route in-process, returning the response body."""
+        return self.loop.run_until_complete(
+            self.api.app.request(method, path, body)
+        ).body
+
+    def reset_bath(self, temp):
+        """Refill the bath at temp, as between cooks."""
+        self.bath.advance()
+        self.bath.temp = temp
+        for probe in self.probes:
+            probe.source.value = temp
+
+    def cook(self, setpoint, seconds):
+        """Switch on at setpoint and run for seconds."""
+        self.controller.set_setpoint(setpoint)
+        self.controller.start_controller()
+        self.run(seconds)
+
+    def autotune(self, setpoint, timeout=12 * 3600):
+        """Autotune about setpoint, returning the tuner's report."""
+        self.controller.autotune(setpoint)
+        self.run(1)
+        start = self.now
+        while self.controller.autotuner.running() and self.now - start < timeout:
+            self.run(60)
+        return self.controller.autotuner.report()
+
+    def run_program(self, steps, timeout=24 * 3600):
+        """Run a cook program to the end, returning how long it took."""
+        self.controller.start_program(steps)
+        start = self.now
+        while self.controller.program.running() and self.now - start < timeout:
+            self.run(60)
+        return self.now - start
+
+    def settle_time(self, setpoint, band=0.2, since=0):
+        """Seconds from since after which the bath stays within band of setpoint."""
+        settled = None
+        for t, temp, *_ in self.trace:
+            if t < since:
+                continue
+            if abs(temp - setpoint) > band:
+                settled = None
+            elif settled is None:
+                settled = t
+        return None if settled is None else settled - since
+
+    def overshoot(self, setpoint, since=0):
+        return max(temp for t, temp, *_ in self.trace if t >= since) - setpoint
+
+    def write_trace(self, fn):
+        with open(fn, "w") as f:
+            f.write("t,bath,measured,duty,setpoint,state\n")
+            for row in self.trace:
+                f.write(",".join(str(x) for x in row) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--setpoint", type=float, default=60)
+    parser.add_argument("--hours", type=float, default=3)
+    parser.add_argument("--volume", type=float, default=8)
+    parser.add_argument("--power", type=float, default=1000)
+    parser.add_argument("--start", type=float, default=20)
+    parser.add_argument("--probes", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--windup-clamp", action="store_true")
+    parser.add_argument(
+        "--autotune", action="store_true", help="autotune at setpoint first"
+    )
+    parser.add_argument(
+        "--program", help="run this JSON cook program instead of a fixed setpoint"
+    )
+    parser.add_argument("--trace", help="write a CSV trace here")
+    args = parser.parse_args()
+
+    trace = args.trace and os.path.abspath(args.trace)
+    wall = time.perf_counter()
+    sim = Simulation(
+        volume=args.volume,
+        power=args.power,
+        start=args.start,
+        probes=args.probes,
+        seed=args.seed,
+    )
+    sim.hal.config["windup_clamp"] = args.windup_clamp
+    if args.autotune:
+        print("autotune", sim.autotune(args.setpoint))
+        for rule, params in zip(
+            sim.controller.autotuner.tuning_rules, sim.controller.generated_params
+        ):
+            print("  {}: {}".format(rule, params))
+        sim.reset_bath(args.start)
+    if args.program:
+        took = sim.run_program(json.loads(args.program), args.hours * 3600)
+        print("program {} after {:.0f} s".format(sim.controller.program.state, took))
+        print("peak bath {:.2f} C".format(max(temp for _, temp, *_ in sim.trace)))
+        if trace:
+            sim.write_trace(trace)
+        return
+    since = sim.now
+    sim.cook(args.setpoint, args.hours * 3600)
+    wall = time.perf_counter() - wall
+
+    settle = sim.settle_time(args.setpoint, since=since)
+    print("simulated {:.1f} h in {:.1f} s".format(args.hours, wall))
+    print(
+        "settled within 0.2 C after {}".format(
+            "{:.0f} s".format(settle) if settle is not None else "never"
+        )
+    )
+    print("overshoot {:.2f} C".format(sim.overshoot(args.setpoint, since=since)))
+    print(
+        "final bath {:.2f} C, energy {:.0f} kJ".format(
+            sim.bath.advance(), sim.bath.energy / 1000
+        )
+    )
+    if trace:
+        sim.write_trace(trace)
+
+
+if __name__ == "__main__":
+    main()
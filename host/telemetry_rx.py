@@ -0,0 +1,138 @@
+"""
+Receive the cookers' UDP telemetry frames, decoding them and reporting gaps.
+
+Each board sends a fixed-layout frame (see FORMAT, which must match
+firmware/telemetry.py) every telemetry_ms to telemetry_host, which may be a
+multicast group.  Frames are tracked per device by sequence number: a jump
+counts the frames between as lost, and an older sequence number is a late or
+duplicate frame.  A new boot id means the board restarted, counting from 0.
+
+Usage: python host/telemetry_rx.py [--port 5005] [--group 239.1.2.3] [--quiet]
+"""
+import argparse
+import math
+import socket
+import struct
+import time
+from collections import namedtuple
+
+MAGIC = b"SV"
+VERSION = 1
+FORMAT = "<2sBB6s2sIIfffffHi"
+SIZE = struct.calcsize(FORMAT)
+STATES = ("idle", "heating", "holding", "autotuning", "manual")
+
+Frame = namedtuple(
+    "Frame",
+    "device state boot seq uptime_ms temperature setpoint p i d duty countdown",
+)
+
+
+def decode(data):
+    """The Frame in data, or None if it is not a telemetry frame we know."""
+    if len(data) != SIZE:
+        return None
+    magic, version, state, device, boot, *rest = struct.unpack(FORMAT, data)
+    if magic != MAGIC or version != VERSION:
+        return None
+    frame = Frame(device.hex(), STATES[state], boot.hex(), *rest)
+    if math.isnan(frame.temperature):
+        frame = frame._replace(temperature=None)
+    if frame.countdown < 0:
+        frame = frame._replace(countdown=None)
+    return frame
+
+
+class Tracker:
+    """Sequence bookkeeping for one device."""
+
+    def __init__(self):
+        self.last = None
+        self.received = 0
+        self.lost = 0
+        self.late = 0
+        self.restarts = 0
+
+    def update(self, frame):
+        """Account for frame, returning the number of frames missed before it."""
+        self.received += 1
+        last, self.last = self.last, frame
+        if last is None:
+            return 0
+        if frame.boot != last.boot:
+            self.restarts += 1
+            # frames sent before this one since the restart are lost.
+            self.lost += frame.seq
+            return frame.seq
+        if frame.seq > last.seq:
+            gap = frame.seq - last.seq - 1
+            self.lost += gap
+            return gap
+        self.late += 1
+        # keep the newest frame as the reference.
+        self.last = last
+        return 0
+
+    def loss(self):
+        total = self.received + self.lost
+        return self.lost / total if total else 0.0
+
+
+def receive(sock, quiet=False, summary_s=60):
+    trackers = {}
+    next_summary = time.monotonic() + summary_s
+    while True:
+        sock.settimeout(max(0.1, next_summary - time.monotonic()))
+        try:
+            data, addr = sock.recvfrom(512)
+        except socket.timeout:
+            data = None
+        if data is not None:
+            frame = decode(data)
+            if frame is None:
+                print("{}: not a telemetry frame".format(addr[0]))
+                continue
+            tracker = trackers.setdefault(frame.device, Tracker())
+            restarts = tracker.restarts
+            gap = tracker.update(frame)
+            if gap:
+                print("{} {}: lost {} frames".format(frame.device, addr[0], gap))
+            if tracker.restarts != restarts:
+                print("{} {}: restarted".format(frame.device, addr[0]))
+            if not quiet:
+                print("{} {}".format(addr[0], frame))
+        if time.monotonic() >= next_summary:
+            next_summary += summary_s
+            for device, t in sorted(trackers.items()):
+                print(
+                    "{}: {} received, {} lost ({:.2%}), {} late, {} restarts".format(
+                        device, t.received, t.lost, t.loss(), t.late, t.restarts
+                    )
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=5005)
+    parser.add_argument("--bind", default="", help="address to listen on")
+    parser.add_argument("--group", help="multicast group to join")
+    parser.add_argument(
+        "--quiet", action="store_true", help="only report gaps and summaries"
+    )
+    parser.add_argument("--summary", type=float, default=60, help="seconds")
+    args = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.bind, args.port))
+    if args.group:
+        mreq = socket.inet_aton(args.group) + socket.inet_aton("0.0.0.0")
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    try:
+        receive(sock, args.quiet, args.summary)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+A virtual clock for asyncio.
+
+VirtualLoop is an ordinary selector event loop whose time() is a counter.
+Whenever the loop would block waiting for its next timer, the counter is
+advanced to that timer instead, so code sleeping for hours runs as fast as
+the CPU allows, and runs identically every time.
+"""
+import asyncio
+import selectors
+
+
+class VirtualClock:
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+class _Selector(selectors.SelectSelector):
+    def __init__(self, clock):
+        super().__init__()
+        self._clock = clock
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError("virtual loop would block forever")
+        if timeout > 0:
+            self._clock.now += timeout
+        return super().select(0)
+
+
+class VirtualLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock=None):
+        self.clock = clock or VirtualClock()
+        super().__init__(_Selector(self.clock))
+
+    def time(self):
+        return self.clock.now
@@ -23,6 +23,10 @@ def addLevelName(level, name):
     _level_dict[level] = name
 
 
+# bumped whenever a level changes, invalidating cached effective levels.
+_generation = 0
+
+
 class Logger:
 
     level = NOTSET
@@ -31,6 +35,8 @@ class Logger:
         self.name = name
         self.handlers = None
         self.parent = None
+        self._generation = -1
+        self._dest = None
 
     def _level_str(self, level):
         l = _level_dict.get(level)
@@ -39,40 +45,67 @@ class Logger:
         return "LVL%s" % level
 
     def setLevel(self, level):
+        global _generation
         self.level = level
+        _generation += 1
+
+    def _resolve(self):
+        """Find (and cache) the logger whose level and handlers apply."""
+        if self._generation != _generation:
+            dest = self
+            while dest.level == NOTSET and dest.parent:
+                dest = dest.parent
+            self._dest = dest
+            self._generation = _generation
+        return self._dest
+
+    def getEffectiveLevel(self):
+        return self._resolve().level
 
     def isEnabledFor(self, level):
-        return level >= self.level
+        return level >= self._resolve().level
 
     def log(self, level, msg, *args):
-        dest = self
-        while dest.level == NOTSET and dest.parent:
-            dest = dest.parent
+        dest = self._resolve()
         if level >= dest.level:
-            record = LogRecord(
-                self.name, level, None, None, msg, args, None, None, None
-            )
+            self._emit(dest, level, msg, args)
+
+    def _emit(self, dest, level, msg, args):
+        record = LogRecord(self.name, level, None, None, msg, args, None, None, None)
+        if dest.handlers:
+            for hdlr in dest.handlers:
+                hdlr.emit(record)
 
-            if dest.handlers:
-                for hdlr in dest.handlers:
-                    hdlr.emit(record)
+    # The level methods check the cached level first, so suppressed calls
+    # cost one comparison.  Pass arguments rather than preformatting the
+    # message: they are only %-formatted if a record is emitted.
 
     def debug(self, msg, *args):
-        self.log(DEBUG, msg, *args)
+        dest = self._resolve()
+        if DEBUG >= dest.level:
+            self._emit(dest, DEBUG, msg, args)
 
     def info(self, msg, *args):
-        self.log(INFO, msg, *args)
+        dest = self._resolve()
+        if INFO >= dest.level:
+            self._emit(dest, INFO, msg, args)
 
     def warning(self, msg, *args):
-        self.log(WARNING, msg, *args)
+        dest = self._resolve()
+        if WARNING >= dest.level:
+            self._emit(dest, WARNING, msg, args)
 
     warn = warning
 
     def error(self, msg, *args):
-        self.log(ERROR, msg, *args)
+        dest = self._resolve()
+        if ERROR >= dest.level:
+            self._emit(dest, ERROR, msg, args)
 
     def critical(self, msg, *args):
-        self.log(CRITICAL, msg, *args)
+        dest = self._resolve()
+        if CRITICAL >= dest.level:
+            self._emit(dest, CRITICAL, msg, args)
 
     def exc(self, e, msg, *args):
         buf = uio.StringIO()
@@ -191,6 +224,55 @@ class FileHandler(StreamHandler):
             self._stream.close()
 
 
+def _compile(fmt, style):
+    """
+    Split a format string into positional form and the fields it uses.
+
+    "%(name)s: %(message)s" becomes ("%s: %s", ("name", "message")), and
+    "{name}: {message:>8}" becomes ("{}: {:>8}", ("name", "message")).
+    """
+    out = []
+    fields = []
+    i = 0
+    if style == "%":
+        while True:
+            j = fmt.find("%", i)
+            if j < 0 or j == len(fmt) - 1:
+                break
+            out.append(fmt[i : j + 1])
+            if fmt[j + 1] == "%":
+                out.append("%")
+                i = j + 2
+            elif fmt[j + 1] == "(":
+                k = fmt.index(")", j)
+                fields.append(fmt[j + 2 : k])
+                i = k + 1
+            else:
+                i = j + 1
+    else:
+        while True:
+            j = fmt.find("{", i)
+            if j < 0:
+                break
+            if fmt[j + 1 : j + 2] == "{":
+                out.append(fmt[i : j + 2])
+                i = j + 2
+                continue
+            k = fmt.index("}", j)
+            field = fmt[j + 1 : k]
+            spec = ""
+            for sep in ("!", ":"):
+                if sep in field:
+                    field, rest = field.split(sep, 1)
+                    spec = sep + rest
+                    break
+            out.append(fmt[i:j] + "{" + spec + "}")
+            fields.append(field)
+            i = k + 1
+    out.append(fmt[i:])
+    return "".join(out), tuple(fields)
+
+
 class Formatter:
 
     converter = utime.localtime
@@ -203,20 +285,21 @@ class Formatter:
             raise ValueError("Style must be one of: %, {")
 
         self.style = style
+        # The format string is parsed once here rather than for every record.
+        self._fmt, self._fields = _compile(self.fmt, style)
+        self._uses_time = "asctime" in self._fields
 
     def usesTime(self):
-        if self.style == "%":
-            return "%(asctime)" in self.fmt
-        elif self.style == "{":
-            return "{asctime" in self.fmt
+        return self._uses_time
 
     def format(self, record):
-        # The message attribute of the record is computed using msg % args.
-        record.message = record.msg % record.args
+        # The message attribute of the record is computed using msg % args,
+        # only now that the record is known to be emitted.
+        record.message = record.msg % record.args if record.args else str(record.msg)
 
         # If the formatting string contains '(asctime)', formatTime() is called to
         # format the event time.
-        if self.usesTime():
+        if self._uses_time:
             record.asctime = self.formatTime(record, self.datefmt)
 
         # If there is exception information, it is formatted using formatException()
@@ -226,16 +309,10 @@ class Formatter:
             record.exc_text += self.formatException(record.exc_info)
             record.message += "\n" + record.exc_text
 
-        # The record’s attribute dictionary is used as the operand to a string
-        # formatting operation.
+        values = tuple(getattr(record, f) for f in self._fields)
         if self.style == "%":
-            return self.fmt % record.__dict__
-        elif self.style == "{":
-            return self.fmt.format(**record.__dict__)
-        else:
-            raise ValueError(
-                "Style {0} is not supported by logging.".format(self.style)
-            )
+            return self._fmt % values
+        return self._fmt.format(*values)
 
     def formatTime(self, record, datefmt=None):
         assert datefmt is None  # datefmt is not supported
@@ -1,6 +1,9 @@
 import os
 import sys
-from . import Handler
+
+import uasyncio as asyncio
+
+from . import ERROR, Handler
 
 
 def try_remove(fn: str) -> None:
@@ -33,32 +36,120 @@ class RotatingFileHandler(Handler):
         except OSError:
             self._counter = 0
 
+    def doRollover(self):
+        """Shift the backup files along and start a new log file."""
+        # remove the last backup file if it is there
+        try_remove(self.filename + ".{0}".format(self.backupCount))
+
+        for i in range(self.backupCount - 1, 0, -1):
+            if i < self.backupCount:
+                try:
+                    os.rename(
+                        self.filename + ".{0}".format(i),
+                        self.filename + ".{0}".format(i + 1),
+                    )
+                except OSError:
+                    pass
+
+        try:
+            os.rename(self.filename, self.filename + ".1")
+        except OSError:
+            pass
+        self._counter = 0
+
+    def shouldRollover(self, size):
+        """Whether writing size more bytes would overrun maxBytes."""
+        return (
+            self.maxBytes and self.backupCount and self._counter + size > self.maxBytes
+        )
+
     def emit(self, record):
         """Write to file."""
         msg = self.formatter.format(record)
         s_len = len(msg)
 
-        if self.maxBytes and self.backupCount and self._counter + s_len > self.maxBytes:
-            # remove the last backup file if it is there
-            try_remove(self.filename + ".{0}".format(self.backupCount))
-
-            for i in range(self.backupCount - 1, 0, -1):
-                if i < self.backupCount:
-                    try:
-                        os.rename(
-                            self.filename + ".{0}".format(i),
-                            self.filename + ".{0}".format(i + 1),
-                        )
-                    except OSError:
-                        pass
-
-            try:
-                os.rename(self.filename, self.filename + ".1")
-            except OSError:
-                pass
-            self._counter = 0
+        if self.shouldRollover(s_len):
+            self.doRollover()
 
         with open(self.filename, "a") as f:
             f.write(msg + "\n")
 
         self._counter += s_len
+
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    """A RotatingFileHandler which coalesces writes.
+
+    Records are copied into a preallocated buffer and written out by a
+    background task when the buffer fills past `flushBytes`, every
+    `flushInterval` ms, or at once for records at `flushLevel` or above.
+    Rollover is checked at flush time.  Records which do not fit in the
+    buffer are dropped: `dropped` counts them, and a note is written to the
+    log at the next flush.
+    """
+
+    def __init__(
+        self,
+        filename,
+        maxBytes=0,
+        backupCount=0,
+        bufferSize=2048,
+        flushBytes=None,
+        flushInterval=5000,
+        flushLevel=ERROR,
+    ):
+        super().__init__(filename, maxBytes, backupCount)
+        self._buf = bytearray(bufferSize)
+        self._mv = memoryview(self._buf)
+        self._len = 0
+        self.flushBytes = flushBytes or bufferSize * 3 // 4
+        self.flushInterval = flushInterval
+        self.flushLevel = flushLevel
+        self.dropped = 0
+        self._unreported = 0
+        self._flush_event = asyncio.Event()
+        asyncio.get_event_loop().create_task(self._flush_loop())
+
+    def emit(self, record):
+        """Buffer record, waking the flush task if a threshold is reached."""
+        if record.levelno < self.level:
+            return
+        msg = (self.formatter.format(record) + "\n").encode()
+        end = self._len + len(msg)
+        if end > len(self._buf):
+            self.dropped += 1
+            self._unreported += 1
+            self._flush_event.set()
+            return
+        self._mv[self._len : end] = msg
+        self._len = end
+        if end >= self.flushBytes or record.levelno >= self.flushLevel:
+            self._flush_event.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for_ms(self._flush_event.wait(), self.flushInterval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            self.flush()
+
+    def flush(self):
+        """Write out the buffer, rolling over first if needed."""
+        size = self._len
+        note = None
+        if self._unreported:
+            note = "-- dropped {} log records --\n".format(self._unreported).encode()
+            self._unreported = 0
+            size += len(note)
+        if not size:
+            return
+        if self.shouldRollover(size):
+            self.doRollover()
+        with open(self.filename, "ab") as f:
+            f.write(self._mv[: self._len])
+            if note:
+                f.write(note)
+        self._counter += size
+        self._len = 0